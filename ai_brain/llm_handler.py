@@ -1,24 +1,85 @@
-import openai
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from config import Config
+from ai_brain.plan_repair import PROMPT_ELEMENT_LIMIT, parse_plan_json, repair_plan, build_correction_prompt, split_batch_reply
+from ai_brain.usage import TaskUsage
+from core.deadline import Deadline
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "You are a professional web automation expert. Generate detailed automation steps based on user goals and page information."
+
+PLAN_FORMAT = """[
+    {
+        "action": "wait|click|type|get_text|screenshot",
+        "selector": "CSS selector",
+        "text": "Text to type (only for type action)",
+        "timeout": "Timeout in milliseconds (only for wait action)",
+        "description": "Step description"
+    }
+]"""
+
+# Per-model routing statistics, shared by all handler instances
+_tier_stats: Dict[str, Dict[str, Any]] = {}
+
+def get_tier_stats() -> Dict[str, Dict[str, Any]]:
+    """Get latency, token usage and success rate for each model tier"""
+    summary = {}
+    for model, stats in _tier_stats.items():
+        calls = stats["calls"]
+        attempts = stats["attempts"]
+        summary[model] = {
+            **stats,
+            "avg_latency": stats["total_latency"] / calls if calls else 0.0,
+            # Per plan attempt; correction requests are extra calls within an attempt
+            "success_rate": stats["successes"] / attempts if attempts else 0.0
+        }
+    return summary
+
+def _stats_for(model: str) -> Dict[str, Any]:
+    """Get (or create) the statistics record for a model"""
+    if model not in _tier_stats:
+        _tier_stats[model] = {
+            "calls": 0,
+            "correction_calls": 0,
+            "attempts": 0,
+            "successes": 0,
+            "failures": 0,
+            "total_latency": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+    return _tier_stats[model]
+
 class LLMHandler:
     """LLM handler, responsible for interacting with AI models"""
     
-    def __init__(self):
-        self.client = openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY) if Config.OPENAI_API_KEY else None
+    def __init__(self, model_tiers: Optional[List[str]] = None):
+        self.client = None
+        if Config.OPENAI_API_KEY:
+            # Imported here so importing this module stays cheap for scripted-only workers
+            import openai
+            
+            self.client = openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+        self.model_tiers = model_tiers or Config.LLM_MODEL_TIERS
+        self.last_tier: Optional[int] = None
+        # Tier that planned each goal of the last batch, None where no plan was produced
+        self.batch_tiers: List[Optional[int]] = []
+        # Every call made by this handler, i.e. for the task it plans
+        self.usage = TaskUsage()
     
     async def generate_task_plan(
         self, 
         goal: str, 
         page_info: Dict[str, Any],
-        accessible_elements: List[Dict[str, Any]]
+        accessible_elements: List[Dict[str, Any]],
+        start_tier: int = 0,
+        deadline: Optional[Deadline] = None
     ) -> Optional[List[Dict[str, Any]]]:
-        """Generate task plan based on goal and page information"""
+        """Generate task plan, escalating through model tiers until a valid plan is produced"""
         
         if not self.client:
             logger.error("OpenAI API key not configured")
@@ -26,39 +87,214 @@ class LLMHandler:
         
         prompt = self._build_prompt(goal, page_info, accessible_elements)
         
-        try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional web automation expert. Generate detailed automation steps based on user goals and page information."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1
-            )
+        deadline = deadline or Deadline()
+        for tier in range(start_tier, len(self.model_tiers)):
+            if deadline.expired:
+                logger.error("Task deadline exceeded before a plan was generated")
+                return None
+            plan = await self._request_plan(self.model_tiers[tier], prompt, accessible_elements, deadline)
+            if plan is not None:
+                self.last_tier = tier
+                return plan
+            if tier + 1 < len(self.model_tiers):
+                logger.warning(f"Model {self.model_tiers[tier]} produced no usable plan, escalating to {self.model_tiers[tier + 1]}")
+        
+        return None
+    
+    async def generate_batch_plans(
+        self,
+        goals: List[str],
+        page_info: Dict[str, Any],
+        accessible_elements: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> List[Optional[List[Dict[str, Any]]]]:
+        """Generate one plan per goal, sending the page context once; only goals without a usable plan escalate"""
+        plans: List[Optional[List[Dict[str, Any]]]] = [None] * len(goals)
+        self.batch_tiers = [None] * len(goals)
+        if not self.client:
+            logger.error("OpenAI API key not configured")
+            return plans
+        
+        deadline = deadline or Deadline()
+        pending = list(range(len(goals)))
+        for tier, model in enumerate(self.model_tiers):
+            if not pending:
+                break
+            if deadline.expired:
+                logger.error("Task deadline exceeded before all plans were generated")
+                break
             
-            content = response.choices[0].message.content
-            return self._parse_plan(content)
+            prompt = self._build_batch_prompt([goals[i] for i in pending], page_info, accessible_elements)
+            content = await self._chat(model, [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ], deadline)
+            sections = split_batch_reply(content, len(pending))
+            # One attempt per goal, so a batch weighs as much as the same goals planned one by one
+            stats = _stats_for(model)
+            stats["attempts"] += len(pending)
             
+            # Each plan is parsed and repaired on its own, so one bad plan does not sink the others
+            unplanned = []
+            for number, goal_index in enumerate(pending, 1):
+                plan, problems = self._repair(sections[number], accessible_elements) if number in sections else (None, None)
+                if plan is not None and not problems:
+                    plans[goal_index] = plan
+                    self.batch_tiers[goal_index] = tier
+                else:
+                    unplanned.append(goal_index)
+            
+            if unplanned:
+                stats["failures"] += len(unplanned)
+                if tier + 1 < len(self.model_tiers):
+                    logger.warning(f"Model {model} produced no usable plan for {len(unplanned)} goals, escalating to {self.model_tiers[tier + 1]}")
+            pending = unplanned
+        
+        return plans
+    
+    def has_next_tier(self) -> bool:
+        """Check whether a stronger model is available after the last one used"""
+        return self.last_tier is not None and self.last_tier + 1 < len(self.model_tiers)
+    
+    def record_execution_result(self, success: bool, tier: Optional[int] = None):
+        """Record whether the plan from a tier (the last used one by default) executed successfully"""
+        tier = self.last_tier if tier is None else tier
+        if tier is None:
+            return
+        stats = _stats_for(self.model_tiers[tier])
+        if success:
+            stats["successes"] += 1
+        else:
+            stats["failures"] += 1
+    
+    async def _request_plan(
+        self,
+        model: str,
+        prompt: str,
+        accessible_elements: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Request a plan from a single model, repairing it locally before asking for a correction"""
+        stats = _stats_for(model)
+        stats["attempts"] += 1
+        messages = [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        
+        content = await self._chat(model, messages, deadline)
+        if content is None:
+            stats["failures"] += 1
+            return None
+        
+        plan, problems = self._repair(content, accessible_elements)
+        if plan is not None and not problems:
+            return plan
+        
+        # Only unrecoverable plans go back to the model, with a targeted correction prompt
+        if problems is None:
+            problems = ["The reply did not contain a valid JSON array of steps"]
+        logger.warning(f"Plan from {model} needs correction: {'; '.join(problems)}")
+        messages.append({"role": "assistant", "content": content})
+        messages.append({"role": "user", "content": build_correction_prompt(problems)})
+        
+        stats["correction_calls"] += 1
+        content = await self._chat(model, messages, deadline)
+        plan, problems = self._repair(content, accessible_elements) if content is not None else (None, None)
+        if plan is None or problems:
+            stats["failures"] += 1
+            return None
+        
+        return plan
+    
+    async def _chat(self, model: str, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Send a chat request bounded by the task deadline, recording latency and token usage for the model and the task"""
+        if deadline and deadline.expired:
+            logger.error(f"Task deadline exceeded, skipping request to {model}")
+            return None
+        
+        stats = _stats_for(model)
+        stats["calls"] += 1
+        start_time = time.perf_counter()
+        
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.1
+                ),
+                timeout=deadline.remaining_seconds() if deadline else None
+            )
         except Exception as e:
-            logger.error(f"Failed to generate task plan: {e}")
+            latency = time.perf_counter() - start_time
+            stats["total_latency"] += latency
+            self.usage.record(model, 0, 0, latency, success=False)
+            logger.error(f"Failed to generate task plan with {model}: {e}")
             return None
+        
+        latency = time.perf_counter() - start_time
+        usage = getattr(response, "usage", None)
+        prompt_tokens = (usage.prompt_tokens or 0) if usage else 0
+        completion_tokens = (usage.completion_tokens or 0) if usage else 0
+        stats["total_latency"] += latency
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        self.usage.record(model, prompt_tokens, completion_tokens, latency)
+        
+        return response.choices[0].message.content
+    
+    def _repair(
+        self,
+        content: str,
+        accessible_elements: List[Dict[str, Any]]
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[List[str]]]:
+        """Parse and locally repair a reply; problems is None when no JSON plan was found"""
+        plan = self._parse_plan(content)
+        if plan is None:
+            return None, None
+        return repair_plan(plan, accessible_elements)
     
     def _build_prompt(self, goal: str, page_info: Dict[str, Any], accessible_elements: List[Dict[str, Any]]) -> str:
         """Build prompt"""
+        return f"""
+User Goal: {goal}
+{self._page_context(page_info, accessible_elements)}
+Please generate a detailed automation step plan using the following JSON format:
+{PLAN_FORMAT}
+
+Ensure the steps are logical and include necessary waits and error handling.
+"""
+    
+    def _build_batch_prompt(self, goals: List[str], page_info: Dict[str, Any], accessible_elements: List[Dict[str, Any]]) -> str:
+        """Build one prompt asking for a separate plan for each goal on the same page"""
+        goals_text = "\n".join(f"{number}. {goal}" for number, goal in enumerate(goals, 1))
+        
+        return f"""
+User Goals:
+{goals_text}
+{self._page_context(page_info, accessible_elements)}
+Plan each goal independently. For each goal, write a header line "### Plan <goal number>" followed by
+its automation step plan as a JSON array in the following format:
+{PLAN_FORMAT}
+
+Ensure the steps are logical and include necessary waits and error handling.
+"""
+    
+    def _page_context(self, page_info: Dict[str, Any], accessible_elements: List[Dict[str, Any]]) -> str:
+        """Page information and accessible elements shared by the plan prompts"""
         elements_text = "\n".join([
             f"- {elem.get('role', 'unknown')}: {elem.get('name', 'unnamed')} (selector: {elem.get('selector', 'N/A')})"
-            for elem in accessible_elements[:20]  # Limit number of elements
+            for elem in accessible_elements[:PROMPT_ELEMENT_LIMIT]  # Limit number of elements
         ])
         
         return f"""
-User Goal: {goal}
-
 Page Information:
 - URL: {page_info.get('url', 'N/A')}
 - Title: {page_info.get('title', 'N/A')}
@@ -67,35 +303,8 @@ Page Information:
 
 Accessible Elements:
 {elements_text}
-
-Please generate a detailed automation step plan using the following JSON format:
-[
-    {{
-        "action": "wait|click|type|get_text|screenshot",
-        "selector": "CSS selector",
-        "text": "Text to type (only for type action)",
-        "timeout": "Timeout in milliseconds (only for wait action)",
-        "description": "Step description"
-    }}
-]
-
-Ensure the steps are logical and include necessary waits and error handling.
 """
     
     def _parse_plan(self, content: str) -> Optional[List[Dict[str, Any]]]:
-        """Parse AI-generated plan"""
-        try:
-            # Try to extract JSON part
-            start_idx = content.find('[')
-            end_idx = content.rfind(']') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = content[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                logger.error("Cannot find JSON formatted plan")
-                return None
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse plan JSON: {e}")
-            return None
+        """Parse AI-generated plan, fixing common JSON defects"""
+        return parse_plan_json(content)
@@ -1,4 +1,3 @@
-import httpx
 import json
 import logging
 from typing import Dict, Any, List, Optional
@@ -10,6 +9,8 @@ class MCPClient:
     """MCP client for communicating with Playwright MCP server"""
     
     def __init__(self):
+        import httpx
+        
         self.base_url = Config.MCP_SERVER_URL
         self.client = httpx.AsyncClient(timeout=30.0)
     
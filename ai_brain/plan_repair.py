@@ -0,0 +1,201 @@
+"""Local plan repair - fixes common defects in LLM-generated plans without another model call"""
+import ast
+import json
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VALID_ACTIONS = {"wait", "click", "type", "get_text", "screenshot"}
+
+# Action names models commonly produce instead of the supported ones
+ACTION_ALIASES = {
+    "wait_for": "wait",
+    "wait_for_element": "wait",
+    "wait_for_selector": "wait",
+    "waitforselector": "wait",
+    "click_element": "click",
+    "tap": "click",
+    "press": "click",
+    "fill": "type",
+    "input": "type",
+    "type_text": "type",
+    "enter_text": "type",
+    "gettext": "get_text",
+    "get_text_content": "get_text",
+    "text_content": "get_text",
+    "extract": "get_text",
+    "extract_text": "get_text",
+    "read_text": "get_text",
+    "take_screenshot": "screenshot",
+    "capture": "screenshot",
+    "capture_screenshot": "screenshot"
+}
+
+# Selector values copied from the prompt template rather than the page
+PLACEHOLDER_SELECTORS = {"", "n/a", "none", "null", "css selector", "selector"}
+
+# Every page has these, so plans may use them without the element list
+ALWAYS_PRESENT_SELECTORS = {"body", "html"}
+
+# Accessible elements listed in the plan prompt; selectors are checked against the same ones
+PROMPT_ELEMENT_LIMIT = 20
+
+_CODE_FENCE = re.compile(r"```(?:json|javascript|js|python)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_LINE_COMMENT = re.compile(r"^\s*//.*$", re.MULTILINE)
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_PLAN_HEADER = re.compile(r"^[#*\s]*Plan\s+(\d+)\b.*$", re.MULTILINE | re.IGNORECASE)
+
+def extract_json_text(content: str) -> Optional[str]:
+    """Extract the JSON array part of a model reply"""
+    if not content:
+        return None
+    
+    fenced = _CODE_FENCE.search(content)
+    if fenced:
+        content = fenced.group(1)
+    
+    start_idx = content.find('[')
+    end_idx = content.rfind(']')
+    if start_idx == -1 or end_idx < start_idx:
+        return None
+    return content[start_idx:end_idx + 1]
+
+def repair_json(text: str) -> Optional[Any]:
+    """Parse JSON, fixing trailing commas, comments, smart quotes and single quotes"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    
+    cleaned = text.translate(_SMART_QUOTES)
+    cleaned = _LINE_COMMENT.sub("", cleaned)
+    cleaned = _TRAILING_COMMA.sub(r"\1", cleaned)
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    
+    # Single-quoted or Python-style literals (True/False/None)
+    try:
+        return ast.literal_eval(cleaned)
+    except (ValueError, SyntaxError):
+        pass
+    
+    python_style = re.sub(r"\btrue\b", "True", cleaned)
+    python_style = re.sub(r"\bfalse\b", "False", python_style)
+    python_style = re.sub(r"\bnull\b", "None", python_style)
+    try:
+        return ast.literal_eval(python_style)
+    except (ValueError, SyntaxError):
+        return None
+
+def parse_plan_json(content: str) -> Optional[List[Any]]:
+    """Extract and parse a plan from a model reply"""
+    json_text = extract_json_text(content)
+    if json_text is None:
+        logger.error("Cannot find JSON formatted plan")
+        return None
+    
+    plan = repair_json(json_text)
+    if not isinstance(plan, list):
+        logger.error("Failed to parse plan JSON")
+        return None
+    return plan
+
+def split_batch_reply(content: str, count: int) -> Dict[int, str]:
+    """Split a multi-goal reply into the text under each "### Plan <n>" header, so each plan parses on its own"""
+    if not content:
+        return {}
+    headers = list(_PLAN_HEADER.finditer(content))
+    if not headers:
+        # A single goal may come back without its header
+        return {1: content} if count == 1 else {}
+    
+    sections = {}
+    for header, following in zip(headers, headers[1:] + [None]):
+        number = int(header.group(1))
+        if 1 <= number <= count and number not in sections:
+            sections[number] = content[header.end():following.start() if following else len(content)]
+    return sections
+
+def normalize_action(action: Any) -> Optional[str]:
+    """Map an action name onto one of the supported actions"""
+    if not isinstance(action, str):
+        return None
+    name = re.sub(r"[\s\-]+", "_", action.strip().lower())
+    if name in VALID_ACTIONS:
+        return name
+    return ACTION_ALIASES.get(name)
+
+def repair_plan(
+    plan: List[Any],
+    accessible_elements: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Normalize a parsed plan, returning the repaired steps and any unrecoverable problems"""
+    elements = (accessible_elements or [])[:PROMPT_ELEMENT_LIMIT]
+    known_selectors = {elem.get("selector") for elem in elements if elem.get("selector")}
+    selectors_by_name = {
+        str(elem.get("name", "")).strip().lower(): elem.get("selector")
+        for elem in elements
+        if elem.get("name") and elem.get("selector")
+    }
+    
+    repaired = []
+    problems = []
+    
+    if not plan:
+        return repaired, ["Plan contains no steps"]
+    
+    for i, step in enumerate(plan):
+        if not isinstance(step, dict):
+            problems.append(f"Step {i} is not a JSON object")
+            continue
+        
+        step = dict(step)
+        action = normalize_action(step.get("action"))
+        if action is None:
+            problems.append(f"Step {i} has unsupported action {step.get('action')!r}; use one of {sorted(VALID_ACTIONS)}")
+            continue
+        step["action"] = action
+        
+        if "timeout" in step:
+            try:
+                step["timeout"] = int(step["timeout"])
+            except (TypeError, ValueError):
+                del step["timeout"]
+        
+        if action != "screenshot":
+            selector = str(step.get("selector") or "").strip()
+            if selector not in known_selectors and selector.lower() not in ALWAYS_PRESENT_SELECTORS:
+                matched = selectors_by_name.get(selector.lower())
+                if matched:
+                    logger.info(f"Step {i}: replaced element name {selector!r} with selector {matched!r}")
+                    selector = matched
+                elif selector.lower() in PLACEHOLDER_SELECTORS:
+                    problems.append(f"Step {i} ({action}) has no usable selector")
+                    continue
+                elif known_selectors:
+                    problems.append(f"Step {i} ({action}) uses selector {selector!r}, which is not in the element list")
+                    continue
+            step["selector"] = selector
+        
+        if action == "type" and step.get("text") is None:
+            problems.append(f"Step {i} (type) is missing the text to type")
+            continue
+        
+        repaired.append(step)
+    
+    return repaired, problems
+
+def build_correction_prompt(problems: List[str]) -> str:
+    """Build a targeted follow-up prompt listing what is wrong with a plan"""
+    problem_text = "\n".join(f"- {problem}" for problem in problems)
+    return f"""
+The plan you returned cannot be executed:
+{problem_text}
+
+Return only the corrected JSON array of steps, using the selectors from the element list.
+"""
@@ -1,8 +1,13 @@
 import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+from typing import AsyncContextManager, Callable, Dict, Any, List, Optional
 from ai_brain.mcp_client import MCPClient
 from ai_brain.llm_handler import LLMHandler
+from ai_brain.template_library import SEARCH_PLAN, CONTENT_PLAN, PAGE_TITLE_PLAN, get_template_library
+from ai_brain.usage import TaskUsage, tenant_ledger
+from config import Config
+from core.admission import AdmissionRejected
+from core.deadline import Deadline
 from core.task_executor import TaskExecutor
 
 logger = logging.getLogger(__name__)
@@ -10,17 +15,63 @@ logger = logging.getLogger(__name__)
 class AITaskPlanner:
     """AI task planner, integrates MCP and LLM functionality"""
     
-    def __init__(self):
+    def __init__(self, run_guard: Optional[Callable[[], AsyncContextManager]] = None):
         self.mcp_client = MCPClient()
         self.llm_handler = LLMHandler()
         self.task_executor = TaskExecutor()
+        self.model_tiers = self.llm_handler.model_tiers
+        self.template_library = get_template_library() if Config.TEMPLATE_LIBRARY_ENABLED else None
+        self.run_guard = run_guard  # Entered around each plan execution, e.g. to hold a browser admission slot
     
-    async def execute_ai_task(self, goal: str, url: str) -> Dict[str, Any]:
-        """Execute AI-driven task"""
+    async def execute_ai_task(
+        self,
+        goal: str,
+        url: str,
+        deadline_ms: Optional[int] = None,
+        tenant: Optional[str] = None,
+        profile: bool = False
+    ) -> Dict[str, Any]:
+        """Execute AI-driven task, under a profiler when profile is set"""
+        try:
+            if profile:
+                from core.profiling import profile_run
+                
+                return await profile_run("ai_task", self._execute_ai_task(goal, url, deadline_ms, tenant))
+            return await self._execute_ai_task(goal, url, deadline_ms, tenant)
+        finally:
+            # Every exit closes the MCP session, including an admission rejection
+            await self.mcp_client.close()
+    
+    async def _execute_ai_task(
+        self,
+        goal: str,
+        url: str,
+        deadline_ms: Optional[int],
+        tenant: Optional[str]
+    ) -> Dict[str, Any]:
+        """Execute AI-driven task, with analysis, planning and execution sharing one deadline"""
+        deadline = Deadline(deadline_ms)
+        self.llm_handler.usage = TaskUsage()
+        
+        # 0. A recurring goal runs its matching template directly, without page analysis or LLM calls
+        template_result = await self._run_template(goal, url, deadline)
+        if template_result and template_result["success"]:
+            return template_result
+        
+        budget = tenant_ledger.check(tenant)
+        if budget == "reject":
+            logger.warning("LLM token budget exceeded, rejecting AI task")
+            return {"success": False, "error": "LLM token budget exceeded", "budget_exceeded": True}
+        # Over the soft budget: cheapest tier only, no escalation
+        self.llm_handler.model_tiers = self.model_tiers[:1] if budget == "downgrade" else self.model_tiers
+        if budget == "downgrade":
+            logger.warning(f"LLM soft token budget exceeded, using only {self.model_tiers[0]}")
+        
+        result = {"success": False, "error": "AI task execution interrupted"}
         try:
             # 1. Get page info (use mock data if MCP server unavailable)
             logger.info("Analyzing page...")
-            page_info = await self.mcp_client.get_page_info(url)
+            page_info = await self._within(self.mcp_client.get_page_info(url), deadline)
             if not page_info:
                 # If MCP server unavailable, use mock data
                 logger.warning("MCP server unavailable, using mock data")
@@ -32,89 +83,195 @@ class AITaskPlanner:
                 }
             
             # 2. Get accessible elements
-            accessible_elements = await self.mcp_client.get_accessible_elements(url)
+            accessible_elements = await self._within(self.mcp_client.get_accessible_elements(url), deadline)
             if not accessible_elements:
                 # If no MCP server, create a simple fallback plan
                 logger.warning("Cannot get page elements, creating basic task plan")
                 
-                # Smart fallback based on goal
-                goal_lower = goal.lower()
-                if "search" in goal_lower or "find" in goal_lower:
-                    plan = [
-                        {
-                            "action": "wait",
-                            "selector": "input[type='search'], input[name*='search'], input[id*='search']",
-                            "timeout": 10000,
-                            "description": "Wait for search box"
-                        },
-                        {
-                            "action": "screenshot",
-                            "path": "search_page.png",
-                            "description": "Take screenshot of page"
-                        }
-                    ]
-                elif "quote" in goal_lower or "text" in goal_lower or "get" in goal_lower:
-                    plan = [
-                        {
-                            "action": "wait",
-                            "selector": ".quote, blockquote, .text, article",
-                            "timeout": 10000,
-                            "description": "Wait for content to load"
-                        },
-                        {
-                            "action": "get_text",
-                            "selector": ".quote .text, blockquote, .text",
-                            "description": "Get text content"
-                        },
-                        {
-                            "action": "screenshot",
-                            "path": "content_page.png",
-                            "description": "Take screenshot"
-                        }
-                    ]
-                else:
-                    # Default plan
-                    plan = [
-                        {
-                            "action": "wait",
-                            "selector": "body",
-                            "timeout": 5000,
-                            "description": "Wait for page to load"
-                        },
-                        {
-                            "action": "get_text",
-                            "selector": "h1, .title, title",
-                            "description": "Get page title"
-                        },
-                        {
-                            "action": "screenshot",
-                            "path": "page_screenshot.png",
-                            "description": "Take screenshot"
-                        }
-                    ]
+                plan = self._fallback_plan(goal)
             else:
                 # 3. Generate task plan using AI
                 logger.info("Generating task plan...")
-                plan = await self.llm_handler.generate_task_plan(goal, page_info, accessible_elements)
+                plan = await self.llm_handler.generate_task_plan(goal, page_info, accessible_elements, deadline=deadline)
                 if not plan:
-                    return {"success": False, "error": "Cannot generate task plan"}
+                    error = "Task deadline exceeded" if deadline.expired else "Cannot generate task plan"
+                    result = {"success": False, "error": error}
+                    return result
             
             logger.info(f"Generated {len(plan)} steps")
             
             # 4. Execute task
-            task_config = {
-                "url": url,
-                "steps": plan
-            }
+            result = await self._execute_plan(url, plan, deadline)
+            
+            # 5. Escalate to a stronger model if the AI plan failed to execute
+            if accessible_elements:
+                self.llm_handler.record_execution_result(result["success"])
+                while not result["success"] and self.llm_handler.has_next_tier() and not deadline.expired:
+                    next_tier = self.llm_handler.last_tier + 1
+                    logger.warning(f"Plan execution failed, retrying with {self.llm_handler.model_tiers[next_tier]}")
+                    retry_plan = await self.llm_handler.generate_task_plan(
+                        goal, page_info, accessible_elements, start_tier=next_tier, deadline=deadline
+                    )
+                    if not retry_plan:
+                        break
+                    plan = retry_plan
+                    result = await self._execute_plan(url, plan, deadline)
+                    self.llm_handler.record_execution_result(result["success"])
+                
+                # Remember plans that worked so the same goal on this site skips the LLM next time
+                if result["success"] and self.template_library:
+                    await self.template_library.add(goal, plan, url)
             
-            result = await self.task_executor.execute_task(task_config)
             result["plan"] = plan
             result["page_info"] = page_info
             
             return result
             
+        except AdmissionRejected:
+            # A full browser queue is the caller's 429, not a failed task
+            raise
         except Exception as e:
             logger.error(f"AI task execution failed: {e}")
-            return {"success": False, "error": str(e)}
+            result = {"success": False, "error": str(e)}
+            return result
         finally:
+            tenant_ledger.record(tenant, self.llm_handler.usage)
+            result["usage"] = self.llm_handler.usage.to_dict()
+    
+    async def execute_ai_tasks(
+        self,
+        goals: List[str],
+        url: str,
+        deadline_ms: Optional[int] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Execute several AI goals on one page, analysing it once and planning all goals in one LLM request"""
+        deadline = Deadline(deadline_ms)
+        self.llm_handler.usage = TaskUsage()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(goals)
+        batch = {"success": False, "error": "AI task execution interrupted", "results": results}
+        
+        try:
+            # Goals with a matching template skip planning
+            for i, goal in enumerate(goals):
+                template_result = await self._run_template(goal, url, deadline)
+                if template_result and template_result["success"]:
+                    results[i] = template_result
+            pending = [i for i, result in enumerate(results) if result is None]
+            if not pending:
+                batch = {"success": True, "results": results}
+                return batch
+            
+            budget = tenant_ledger.check(tenant)
+            if budget == "reject":
+                logger.warning("LLM token budget exceeded, rejecting AI tasks")
+                batch = {"success": False, "error": "LLM token budget exceeded", "budget_exceeded": True, "results": results}
+                return batch
+            self.llm_handler.model_tiers = self.model_tiers[:1] if budget == "downgrade" else self.model_tiers
+            
+            logger.info("Analyzing page...")
+            page_info = await self._within(self.mcp_client.get_page_info(url), deadline)
+            if not page_info:
+                logger.warning("MCP server unavailable, using mock data")
+                page_info = {
+                    "url": url,
+                    "title": "Web Page",
+                    "form_count": 0,
+                    "link_count": 0
+                }
+            accessible_elements = await self._within(self.mcp_client.get_accessible_elements(url), deadline)
+            
+            if accessible_elements:
+                logger.info(f"Generating task plans for {len(pending)} goals...")
+                plans = await self.llm_handler.generate_batch_plans(
+                    [goals[i] for i in pending], page_info, accessible_elements, deadline=deadline
+                )
+            else:
+                logger.warning("Cannot get page elements, creating basic task plans")
+                plans = [self._fallback_plan(goals[i]) for i in pending]
+            
+            for number, (goal_index, plan) in enumerate(zip(pending, plans)):
+                if not plan:
+                    error = "Task deadline exceeded" if deadline.expired else "Cannot generate task plan"
+                    results[goal_index] = {"success": False, "error": error}
+                    continue
+                
+                result = await self._execute_plan(url, plan, deadline)
+                if accessible_elements:
+                    self.llm_handler.record_execution_result(result["success"], tier=self.llm_handler.batch_tiers[number])
+                    if result["success"] and self.template_library:
+                        await self.template_library.add(goals[goal_index], plan, url)
+                result["plan"] = plan
+                result["page_info"] = page_info
+                results[goal_index] = result
+            
+            batch = {"success": all(result["success"] for result in results), "results": results}
+            return batch
+            
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.error(f"AI batch execution failed: {e}")
+            batch = {"success": False, "error": str(e), "results": results}
+            return batch
+        finally:
+            # Goals left unplanned share the batch's error
+            for i, result in enumerate(results):
+                if result is None:
+                    results[i] = {"success": False, "error": batch.get("error")}
+            tenant_ledger.record(tenant, self.llm_handler.usage)
+            batch["usage"] = self.llm_handler.usage.to_dict()
             await self.mcp_client.close()
+    
+    @staticmethod
+    def _fallback_plan(goal: str) -> List[Dict[str, Any]]:
+        """Smart fallback based on goal, used when page elements are unavailable"""
+        goal_lower = goal.lower()
+        if "search" in goal_lower or "find" in goal_lower:
+            return SEARCH_PLAN
+        elif "quote" in goal_lower or "text" in goal_lower or "get" in goal_lower:
+            return CONTENT_PLAN
+        else:
+            # Default plan
+            return PAGE_TITLE_PLAN
+    
+    async def _run_template(self, goal: str, url: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+        """Run the best matching template plan, or return None when no template matches confidently"""
+        if not self.template_library:
+            return None
+        match = self.template_library.match(goal, url)
+        if not match:
+            return None
+        
+        template, score = match
+        logger.info(f"Goal matches template {template['id']} (score {score:.2f}), skipping LLM planning")
+        result = await self._execute_plan(url, template["plan"], deadline)
+        await self.template_library.record_result(template["id"], result["success"])
+        if not result["success"]:
+            logger.warning(f"Template {template['id']} failed, falling back to planning")
+        
+        result["plan"] = template["plan"]
+        result["template"] = {"id": template["id"], "score": round(score, 3), "source": template["source"]}
+        result["usage"] = self.llm_handler.usage.to_dict()
+        return result
+    
+    async def _within(self, coro, deadline: Deadline):
+        """Await an MCP call, giving up with None once the task deadline passes"""
+        try:
+            return await asyncio.wait_for(coro, timeout=deadline.remaining_seconds())
+        except asyncio.TimeoutError:
+            logger.error("MCP request cancelled by task deadline")
+            return None
+    
+    async def _execute_plan(self, url: str, plan: List[Dict[str, Any]], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Execute a generated plan against the target URL within what is left of the deadline"""
+        task_config = {
+            "url": url,
+            "steps": plan
+        }
+        if deadline and not deadline.unlimited:
+            task_config["deadline_ms"] = deadline.remaining_ms()
+        if self.run_guard:
+            async with self.run_guard():
+                return await self.task_executor.execute_task(task_config)
+        return await self.task_executor.execute_task(task_config)
@@ -0,0 +1,266 @@
+"""Offline goal-to-plan template matching, so recurring goals skip page analysis and the LLM"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PLAN = [
+    {
+        "action": "wait",
+        "selector": "input[type='search'], input[name*='search'], input[id*='search']",
+        "timeout": 10000,
+        "description": "Wait for search box"
+    },
+    {
+        "action": "screenshot",
+        "path": "search_page.png",
+        "description": "Take screenshot of page"
+    }
+]
+
+CONTENT_PLAN = [
+    {
+        "action": "wait",
+        "selector": ".quote, blockquote, .text, article",
+        "timeout": 10000,
+        "description": "Wait for content to load"
+    },
+    {
+        "action": "get_text",
+        "selector": ".quote .text, blockquote, .text",
+        "description": "Get text content"
+    },
+    {
+        "action": "screenshot",
+        "path": "content_page.png",
+        "description": "Take screenshot"
+    }
+]
+
+PAGE_TITLE_PLAN = [
+    {
+        "action": "wait",
+        "selector": "body",
+        "timeout": 5000,
+        "description": "Wait for page to load"
+    },
+    {
+        "action": "get_text",
+        "selector": "h1, .title, title",
+        "description": "Get page title"
+    },
+    {
+        "action": "screenshot",
+        "path": "page_screenshot.png",
+        "description": "Take screenshot"
+    }
+]
+
+# Hand-curated goals that work on most sites
+CURATED_TEMPLATES = [
+    ("Find the search box on the page", SEARCH_PLAN),
+    ("Get the quotes from the page", CONTENT_PLAN),
+    ("Extract the text content of the page", CONTENT_PLAN),
+    ("Get the page title", PAGE_TITLE_PLAN),
+    ("Take a screenshot of the page", PAGE_TITLE_PLAN)
+]
+
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "to", "for", "from", "and", "or", "with",
+    "all", "this", "that", "me", "my", "please", "it", "its", "is", "at", "by"
+}
+
+# Learned templates that keep failing are no longer matched
+MAX_TEMPLATE_FAILURES = 3
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+def domain_of(url: Optional[str]) -> Optional[str]:
+    """Host name of a URL without a leading www."""
+    if not url:
+        return None
+    host = urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host or None
+
+class TemplateLibrary:
+    """TF-IDF index of plan templates; curated ones are built in, learned ones persist to disk"""
+    
+    def __init__(self, path: Optional[str] = Config.TEMPLATE_LIBRARY_PATH, max_templates: int = Config.TEMPLATE_LIBRARY_MAX):
+        self.path = path
+        self.max_templates = max_templates
+        self.templates: List[Dict[str, Any]] = [
+            self._template(f"curated-{i}", goal, plan, None, "curated")
+            for i, (goal, plan) in enumerate(CURATED_TEMPLATES)
+        ]
+        self.idf: Dict[str, float] = {}
+        self.vectors: List[Dict[str, float]] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        
+        self._load()
+        self._build_index()
+    
+    @staticmethod
+    def _template(template_id: str, goal: str, plan: List[Dict[str, Any]], domain: Optional[str], source: str) -> Dict[str, Any]:
+        return {
+            "id": template_id,
+            "goal": goal,
+            "plan": plan,
+            "domain": domain,
+            "source": source,
+            "successes": 0,
+            "failures": 0
+        }
+    
+    def _load(self):
+        """Load templates learned by earlier runs"""
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.templates.extend(json.load(f))
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Failed to load template library: {e}")
+    
+    def _save(self):
+        """Persist learned templates; runs on a worker thread, each write taking the latest state"""
+        if not self.path:
+            return
+        with self._write_lock:
+            with self._lock:
+                learned = [dict(template) for template in self.templates if template["source"] == "learned"]
+            self._write(learned)
+    
+    def _write(self, learned: List[Dict[str, Any]]):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(learned, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save template library: {e}")
+    
+    def _build_index(self):
+        """Recompute IDF weights and normalized goal vectors (caller holds the lock or owns the library)"""
+        documents = [Counter(tokenize(template["goal"])) for template in self.templates]
+        total = len(documents)
+        document_frequency = Counter(token for document in documents for token in document)
+        self.idf = {token: math.log((1 + total) / (1 + count)) + 1 for token, count in document_frequency.items()}
+        self.vectors = [self._vector(document) for document in documents]
+    
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        """Unit-length TF-IDF vector; unknown tokens get the highest IDF"""
+        unknown_idf = math.log(1 + len(self.templates)) + 1
+        weights = {token: count * self.idf.get(token, unknown_idf) for token, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {token: weight / norm for token, weight in weights.items()} if norm else {}
+    
+    def match(
+        self,
+        goal: str,
+        url: Optional[str] = None,
+        threshold: float = Config.TEMPLATE_MATCH_THRESHOLD,
+        curated_threshold: float = Config.TEMPLATE_CURATED_THRESHOLD
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Best template for a goal on this site, or None if no match is confident enough"""
+        domain = domain_of(url)
+        with self._lock:
+            query = self._vector(Counter(tokenize(goal)))
+            if not query:
+                return None
+            
+            best, best_score = None, 0.0
+            for template, vector in zip(self.templates, self.vectors):
+                # Learned plans use site-specific selectors, so they only match their own domain
+                if template["domain"] and template["domain"] != domain:
+                    continue
+                if template["failures"] >= MAX_TEMPLATE_FAILURES and template["failures"] > template["successes"]:
+                    continue
+                score = sum(weight * vector.get(token, 0.0) for token, weight in query.items())
+                # Generic plans were never checked on this site, so they need a near-exact goal
+                if score < (max(threshold, curated_threshold) if template["source"] == "curated" else threshold):
+                    continue
+                # Prefer a plan learned on this site over a generic one when equally similar
+                if template["domain"]:
+                    score += 1e-6
+                if score > best_score:
+                    best, best_score = template, score
+        
+        if best is None:
+            return None
+        return best, min(best_score, 1.0)
+    
+    async def add(self, goal: str, plan: List[Dict[str, Any]], url: Optional[str] = None) -> Dict[str, Any]:
+        """Add (or refresh) a learned template for a goal that a generated plan achieved"""
+        domain = domain_of(url)
+        normalized = tokenize(goal)
+        with self._lock:
+            for template in self.templates:
+                if template["source"] == "learned" and template["domain"] == domain and tokenize(template["goal"]) == normalized:
+                    template["plan"] = plan
+                    template["failures"] = 0
+                    break
+            else:
+                template = self._template(uuid.uuid4().hex[:12], goal, plan, domain, "learned")
+                self.templates.append(template)
+                
+                # Evict the least successful learned templates beyond the size limit
+                learned = [item for item in self.templates if item["source"] == "learned"]
+                if len(learned) > self.max_templates:
+                    learned.sort(key=lambda item: item["successes"] - item["failures"])
+                    for item in learned[:len(learned) - self.max_templates]:
+                        self.templates.remove(item)
+                
+                self._build_index()
+                logger.info(f"Learned plan template {template['id']} for goal: {goal}")
+        
+        # File writes stay off the event loop
+        await asyncio.to_thread(self._save)
+        return template
+    
+    async def record_result(self, template_id: str, success: bool):
+        """Record whether a matched template's plan executed successfully"""
+        with self._lock:
+            template = next((item for item in self.templates if item["id"] == template_id), None)
+            if template is None:
+                return
+            template["successes" if success else "failures"] += 1
+        if template["source"] == "learned":
+            await asyncio.to_thread(self._save)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Template counts and usage"""
+        with self._lock:
+            return {
+                "curated": sum(1 for template in self.templates if template["source"] == "curated"),
+                "learned": sum(1 for template in self.templates if template["source"] == "learned"),
+                "successes": sum(template["successes"] for template in self.templates),
+                "failures": sum(template["failures"] for template in self.templates)
+            }
+
+_template_library: Optional[TemplateLibrary] = None
+
+def get_template_library() -> TemplateLibrary:
+    """Get the process-wide template library"""
+    global _template_library
+    if _template_library is None:
+        _template_library = TemplateLibrary()
+    return _template_library
+
+def get_template_library_stats() -> Optional[Dict[str, Any]]:
+    """Get stats of the template library, or None if no AI task has used it"""
+    return _template_library.get_stats() if _template_library else None
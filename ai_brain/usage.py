@@ -0,0 +1,143 @@
+"""LLM token, cost and latency accounting per task and per tenant, with token budgets"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS_TENANT = "anonymous"
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "model=prompt/completion,..." prices (USD per 1K tokens)"""
+    prices = {}
+    for item in spec.split(","):
+        model, _, price = item.partition("=")
+        prompt_price, _, completion_price = price.partition("/")
+        try:
+            prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring invalid LLM price entry: {item}")
+    return prices
+
+_prices = parse_prices(Config.LLM_PRICES)
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost of one call in USD, or 0 for models without a configured price"""
+    prompt_price, completion_price = _prices.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+class TaskUsage:
+    """LLM calls made while planning one task"""
+    
+    def __init__(self):
+        self.calls: List[Dict[str, Any]] = []
+    
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, latency: float, success: bool = True):
+        """Record a single LLM call"""
+        self.calls.append({
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            "cost": call_cost(model, prompt_tokens, completion_tokens),
+            "success": success
+        })
+    
+    @property
+    def total_tokens(self) -> int:
+        return sum(call["prompt_tokens"] + call["completion_tokens"] for call in self.calls)
+    
+    @property
+    def cost(self) -> float:
+        return sum(call["cost"] for call in self.calls)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Totals for the task plus each call"""
+        return {
+            "llm_calls": len(self.calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+            "total_tokens": self.total_tokens,
+            "cost": round(self.cost, 6),
+            "latency": sum(call["latency"] for call in self.calls),
+            "calls": self.calls
+        }
+
+class TenantLedger:
+    """Per-tenant LLM usage over a fixed window, checked against the token budgets"""
+    
+    def __init__(
+        self,
+        soft_tokens: int = Config.LLM_TENANT_SOFT_TOKENS,
+        max_tokens: int = Config.LLM_TENANT_MAX_TOKENS,
+        window: int = Config.LLM_BUDGET_WINDOW
+    ):
+        self.soft_tokens = soft_tokens
+        self.max_tokens = max_tokens
+        self.window = window
+        self.tenants: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def _entry(self, tenant: str) -> Dict[str, Any]:
+        """Get a tenant's record, starting a new window when the current one has ended (caller holds the lock)"""
+        now = time.time()
+        entry = self.tenants.get(tenant)
+        if entry is None:
+            entry = self.tenants[tenant] = {
+                "window_start": now,
+                "window_tokens": 0,
+                "window_cost": 0.0,
+                "tasks": 0,
+                "llm_calls": 0,
+                "total_tokens": 0,
+                "cost": 0.0,
+                "rejected": 0,
+                "downgraded": 0
+            }
+        elif self.window > 0 and now - entry["window_start"] >= self.window:
+            entry["window_start"] = now
+            entry["window_tokens"] = 0
+            entry["window_cost"] = 0.0
+        return entry
+    
+    def check(self, tenant: Optional[str]) -> str:
+        """Decide how to serve a tenant's next AI task: ok, downgrade (cheapest tier only) or reject"""
+        with self._lock:
+            entry = self._entry(tenant or ANONYMOUS_TENANT)
+            if self.max_tokens > 0 and entry["window_tokens"] >= self.max_tokens:
+                entry["rejected"] += 1
+                return "reject"
+            if self.soft_tokens > 0 and entry["window_tokens"] >= self.soft_tokens:
+                entry["downgraded"] += 1
+                return "downgrade"
+            return "ok"
+    
+    def record(self, tenant: Optional[str], usage: TaskUsage):
+        """Add a finished task's LLM usage to its tenant"""
+        with self._lock:
+            entry = self._entry(tenant or ANONYMOUS_TENANT)
+            tokens = usage.total_tokens
+            cost = usage.cost
+            entry["tasks"] += 1
+            entry["llm_calls"] += len(usage.calls)
+            entry["window_tokens"] += tokens
+            entry["window_cost"] += cost
+            entry["total_tokens"] += tokens
+            entry["cost"] += cost
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Usage per tenant, with API keys masked"""
+        with self._lock:
+            return {_mask(tenant): dict(entry) for tenant, entry in self.tenants.items()}
+
+def _mask(tenant: str) -> str:
+    """Label for a tenant that does not reveal its API key"""
+    if tenant == ANONYMOUS_TENANT:
+        return tenant
+    return f"{tenant[:4]}...{hashlib.sha256(tenant.encode('utf-8')).hexdigest()[:8]}"
+
+tenant_ledger = TenantLedger()
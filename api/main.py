@@ -1,20 +1,92 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+import json
 import logging
-from api.models import TaskRequest, AITaskRequest, TaskResponse
+import time
+from typing import Any, Dict, Optional
+from api.models import (
+    TaskRequest, AITaskRequest, AIBatchTaskRequest, TaskResponse, BatchTaskRequest, BatchTaskResponse,
+    DryRunRequest, DryRunResponse
+)
+from config import Config
 from core.task_executor import TaskExecutor
-from ai_brain.task_planner import AITaskPlanner
+from core.scheduler import DomainScheduler
+from core.browser_pool import browser_pool, close_browser_pools, get_browser_pool_stats
+from core.asset_cache import get_asset_cache_stats
+from core.logging_config import setup_logging, stop_logging
+from core.result_cache import result_cache
+from core.admission import admission, AdmissionRejected, lane_for
+from core.recurring import RecurringScheduler, load_job_specs
+from core.screenshot_diff import get_change_detector_stats
+from ai_brain.llm_handler import get_tier_stats
+from ai_brain.usage import tenant_ledger
+from ai_brain.template_library import get_template_library_stats
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued JSON records written on a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+async def emit_recurring_change(event: Dict[str, Any]):
+    """Log a recurring job's change event and post it to RECURRING_WEBHOOK_URL if set"""
+    logger.info(f"Recurring job {event['job']} changed: {json.dumps(event, ensure_ascii=False)}")
+    if Config.RECURRING_WEBHOOK_URL:
+        import httpx
+        
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.post(Config.RECURRING_WEBHOOK_URL, json=event)
+            response.raise_for_status()
+
+# Recurring jobs from RECURRING_JOBS_PATH, started with the server
+recurring: Optional[RecurringScheduler] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Optionally warm up heavy dependencies and start recurring jobs before the server reports ready"""
+    global recurring
+    if Config.API_WARMUP:
+        start_time = time.perf_counter()
+        # Pay the AI stack import cost (openai, httpx) now rather than on the first AI request
+        import ai_brain.task_planner
+        
+        if Config.BROWSER_REUSE:
+            await browser_pool.get_browser()
+        logger.info(f"Warm-up finished in {time.perf_counter() - start_time:.2f}s")
+    
+    if Config.RECURRING_JOBS_PATH:
+        # Recurring runs are background work: bulk lane, never rejected
+        recurring = RecurringScheduler(
+            on_change=emit_recurring_change,
+            run_guard=lambda: admission.admit("browser", "bulk", bounded=False)
+        )
+        recurring.add_jobs(load_job_specs(Config.RECURRING_JOBS_PATH))
+        recurring.start()
+        logger.info(f"Started {len(recurring.jobs)} recurring jobs")
+    
+    yield
+    
+    if recurring:
+        await recurring.close()
+        recurring = None
+    await scheduler.close()
+    await close_browser_pools()
+    from core.static_fetcher import static_fetcher
+    
+    await static_fetcher.close()
+    stop_logging()
+
 app = FastAPI(
     title="Web Automation Bot API",
     description="API service for automated web tasks",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Shared scheduler so batches from all clients respect the same per-domain limits;
+# batch tasks take browser slots in the bulk lane and wait in the scheduler instead of being rejected
+scheduler = DomainScheduler(run_guard=lambda: admission.admit("browser", "bulk", bounded=False))
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +96,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Tell overloaded clients when to come back instead of queueing them"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 async def root():
     """Root path, returns API information"""
@@ -33,7 +114,11 @@ async def root():
         "endpoints": {
             "execute_task": "/execute-task",
             "execute_ai_task": "/execute-ai-task",
-            "health": "/health"
+            "execute_ai_batch": "/execute-ai-batch",
+            "execute_batch": "/execute-batch",
+            "dry_run": "/dry-run",
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }
 
@@ -42,8 +127,35 @@ async def health_check():
     """Health check"""
     return {"status": "healthy", "service": "web-automation-bot"}
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for tuning"""
+    from core.static_fetcher import static_fetcher
+    
+    return {
+        "llm_tiers": get_tier_stats(),
+        "llm_tenants": tenant_ledger.get_stats(),
+        "plan_templates": get_template_library_stats(),
+        "scheduler": scheduler.get_stats(),
+        "asset_cache": get_asset_cache_stats(),
+        "static_fetch": static_fetcher.get_stats(),
+        "result_cache": result_cache.get_stats(),
+        "screenshot_changes": get_change_detector_stats(),
+        "admission": admission.get_stats(),
+        "recurring": recurring.get_stats() if recurring else None,
+        "browser_pool": get_browser_pool_stats() if Config.BROWSER_REUSE else None
+    }
+
+def wants_profile(flag: Optional[bool], header: Optional[str]) -> bool:
+    """Whether a request opted into profiling by task flag or X-Profile header"""
+    return bool(flag) or (header or "").strip().lower() in ("1", "true", "yes")
+
 @app.post("/execute-task", response_model=TaskResponse)
-async def execute_task(request: TaskRequest):
+async def execute_task(
+    request: TaskRequest,
+    x_profile: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
     """Execute predefined task"""
     try:
         executor = TaskExecutor()
@@ -53,33 +165,152 @@ async def execute_task(request: TaskRequest):
             "url": str(request.url),
             "steps": [step.dict() for step in request.steps]
         }
+        if request.trace:
+            task_config["trace"] = request.trace.dict(exclude_none=True)
+        if request.asset_cache is not None:
+            task_config["asset_cache"] = request.asset_cache
+        if request.deadline_ms is not None:
+            task_config["deadline_ms"] = request.deadline_ms
+        if wants_profile(request.profile, x_profile):
+            task_config["profile"] = True
+        if request.mode:
+            task_config["mode"] = request.mode
+        if request.cache is not None:
+            task_config["cache"] = request.cache
+        if request.browser_profile:
+            task_config["browser_profile"] = request.browser_profile
         
-        result = await executor.execute_task(task_config)
+        async def run():
+            async with admission.admit("browser", lane_for(x_priority)):
+                return await executor.execute_task(task_config)
+        
+        # Identical read-only requests share one run and reuse recent results; only actual runs take a slot
+        result, cache_status = await result_cache.run(task_config, run)
         
         if result["success"]:
             return TaskResponse(
                 success=True,
                 message=result["message"],
-                results=result["results"]
+                results=result["results"],
+                trace=result.get("trace"),
+                asset_cache=result.get("asset_cache"),
+                profile=result.get("profile"),
+                mode=result.get("mode"),
+                cache_status=cache_status
             )
         else:
             return TaskResponse(
                 success=False,
                 error=result["error"],
-                results=result.get("results")
+                results=result.get("results"),
+                trace=result.get("trace"),
+                profile=result.get("profile"),
+                cache_status=cache_status
             )
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Task execution exception: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/execute-batch", response_model=BatchTaskResponse)
+async def execute_batch(request: BatchTaskRequest):
+    """Execute many predefined tasks with per-domain rate limiting"""
+    try:
+        task_configs = []
+        for task in request.tasks:
+            task_config = {
+                "url": str(task.url),
+                "steps": [step.dict() for step in task.steps]
+            }
+            if task.trace:
+                task_config["trace"] = task.trace.dict(exclude_none=True)
+            if task.asset_cache is not None:
+                task_config["asset_cache"] = task.asset_cache
+            if task.deadline_ms is not None:
+                task_config["deadline_ms"] = task.deadline_ms
+            if task.profile:
+                task_config["profile"] = True
+            if task.mode:
+                task_config["mode"] = task.mode
+            if task.browser_profile:
+                task_config["browser_profile"] = task.browser_profile
+            task_configs.append(task_config)
+        
+        results = await scheduler.run_all(task_configs)
+        
+        return BatchTaskResponse(results=[
+            TaskResponse(
+                success=result["success"],
+                message=result.get("message"),
+                error=result.get("error"),
+                results=result.get("results"),
+                trace=result.get("trace"),
+                asset_cache=result.get("asset_cache"),
+                profile=result.get("profile"),
+                mode=result.get("mode")
+            )
+            for result in results
+        ])
+        
+    except Exception as e:
+        logger.error(f"Batch execution exception: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/dry-run", response_model=DryRunResponse)
+async def dry_run_plans(request: DryRunRequest, x_priority: Optional[str] = Header(None)):
+    """Check plans against a stored DOM snapshot without running them"""
+    try:
+        from core.dry_run import dry_run
+        
+        plans = [[step.dict() for step in steps] for steps in request.plans]
+        # Capturing a missing snapshot launches a browser, so it takes a browser slot
+        result = await dry_run(
+            str(request.url),
+            plans,
+            refresh=request.refresh,
+            run_guard=lambda: admission.admit("browser", lane_for(x_priority))
+        )
+        
+        return DryRunResponse(
+            success=result["success"],
+            error=result.get("error"),
+            reports=result.get("reports")
+        )
+        
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Dry run exception: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/execute-ai-task", response_model=TaskResponse)
-async def execute_ai_task(request: AITaskRequest):
-    """Execute AI-driven task"""
+async def execute_ai_task(
+    request: AITaskRequest,
+    x_api_key: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
+    """Execute AI-driven task, accounting LLM usage to the caller's API key"""
     try:
-        planner = AITaskPlanner()
+        # Imported lazily so workers that only run scripted tasks never load the AI stack
+        from ai_brain.task_planner import AITaskPlanner
+        
+        # Plan executions also hold a browser slot, so AI tasks count against the browser cap
+        lane = lane_for(x_priority)
+        planner = AITaskPlanner(run_guard=lambda: admission.admit("browser", lane))
         
-        result = await planner.execute_ai_task(request.goal, str(request.url))
+        async with admission.admit("ai", lane):
+            result = await planner.execute_ai_task(
+                request.goal,
+                str(request.url),
+                request.deadline_ms,
+                tenant=x_api_key,
+                profile=wants_profile(request.profile, x_profile)
+            )
+        if result.get("budget_exceeded"):
+            raise HTTPException(status_code=429, detail=result["error"])
         
         if result["success"]:
             return TaskResponse(
@@ -87,7 +318,9 @@ async def execute_ai_task(request: AITaskRequest):
                 message=result.get("message", "AI task executed successfully"),
                 results=result.get("results"),
                 plan=result.get("plan"),
-                page_info=result.get("page_info")
+                page_info=result.get("page_info"),
+                usage=result.get("usage"),
+                profile=result.get("profile")
             )
         else:
             return TaskResponse(
@@ -95,16 +328,58 @@ async def execute_ai_task(request: AITaskRequest):
                 error=result["error"],
                 results=result.get("results"),
                 plan=result.get("plan"),
-                page_info=result.get("page_info")
+                page_info=result.get("page_info"),
+                usage=result.get("usage"),
+                profile=result.get("profile")
             )
             
+    except (HTTPException, AdmissionRejected):
+        raise
     except Exception as e:
         logger.error(f"AI task execution exception: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/execute-ai-batch", response_model=BatchTaskResponse)
+async def execute_ai_batch(
+    request: AIBatchTaskRequest,
+    x_api_key: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
+    """Execute several AI goals on one page, planned together in a single LLM request"""
+    try:
+        from ai_brain.task_planner import AITaskPlanner
+        
+        lane = lane_for(x_priority)
+        planner = AITaskPlanner(run_guard=lambda: admission.admit("browser", lane))
+        
+        async with admission.admit("ai", lane):
+            batch = await planner.execute_ai_tasks(request.goals, str(request.url), request.deadline_ms, tenant=x_api_key)
+        if batch.get("budget_exceeded"):
+            raise HTTPException(status_code=429, detail=batch["error"])
+        
+        return BatchTaskResponse(
+            results=[
+                TaskResponse(
+                    success=result["success"],
+                    message=result.get("message"),
+                    error=result.get("error"),
+                    results=result.get("results"),
+                    plan=result.get("plan"),
+                    page_info=result.get("page_info")
+                )
+                for result in batch["results"]
+            ],
+            usage=batch.get("usage")
+        )
+        
+    except (HTTPException, AdmissionRejected):
+        raise
+    except Exception as e:
+        logger.error(f"AI batch execution exception: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
-    from config import Config
     
     uvicorn.run(
         "api.main:app",
@@ -3,18 +3,51 @@ from typing import List, Dict, Any, Optional
 
 class TaskStep(BaseModel):
     action: str
-    selector: str
+    selector: Optional[str] = None
     text: Optional[str] = None
     timeout: Optional[int] = None
     description: Optional[str] = None
+    url: Optional[str] = None
+    id: Optional[str] = None
+    depends_on: Optional[List[str]] = None
+    page: Optional[str] = None
+    steps: Optional[List["TaskStep"]] = None
+    next_selector: Optional[str] = None
+    url_pattern: Optional[str] = None
+    max_pages: Optional[int] = None
+    start_page: Optional[int] = None
+    next_timeout: Optional[int] = None
+    path: Optional[str] = None
+    change_key: Optional[str] = None
+    change_threshold: Optional[int] = None
+
+class TraceOptions(BaseModel):
+    sample_rate: Optional[float] = None
+    on_failure: Optional[bool] = None
+    slow_ms: Optional[int] = None
+    har: Optional[bool] = None
 
 class TaskRequest(BaseModel):
     url: HttpUrl
     steps: List[TaskStep]
+    trace: Optional[TraceOptions] = None
+    asset_cache: Optional[bool] = None
+    deadline_ms: Optional[int] = None
+    profile: Optional[bool] = None
+    mode: Optional[str] = None
+    cache: Optional[bool] = None
+    browser_profile: Optional[str] = None
 
 class AITaskRequest(BaseModel):
     goal: str
     url: HttpUrl
+    deadline_ms: Optional[int] = None
+    profile: Optional[bool] = None
+
+class AIBatchTaskRequest(BaseModel):
+    goals: List[str]
+    url: HttpUrl
+    deadline_ms: Optional[int] = None
 
 class TaskResponse(BaseModel):
     success: bool
@@ -23,3 +56,26 @@ class TaskResponse(BaseModel):
     results: Optional[Dict[str, Any]] = None
     plan: Optional[List[Dict[str, Any]]] = None
     page_info: Optional[Dict[str, Any]] = None
+    trace: Optional[Dict[str, Any]] = None
+    asset_cache: Optional[Dict[str, int]] = None
+    usage: Optional[Dict[str, Any]] = None
+    profile: Optional[str] = None
+    mode: Optional[str] = None
+    cache_status: Optional[str] = None
+
+class BatchTaskRequest(BaseModel):
+    tasks: List[TaskRequest]
+
+class BatchTaskResponse(BaseModel):
+    results: List[TaskResponse]
+    usage: Optional[Dict[str, Any]] = None
+
+class DryRunRequest(BaseModel):
+    url: HttpUrl
+    plans: List[List[TaskStep]]
+    refresh: bool = False
+
+class DryRunResponse(BaseModel):
+    success: bool
+    error: Optional[str] = None
+    reports: Optional[List[Dict[str, Any]]] = None
@@ -0,0 +1,88 @@
+"""
+Browser Profile Benchmark - Compare launch time, navigation latency and memory of each launch profile
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# The sibling benchmark module is importable however this file is started (script, -m or import)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import asyncio
+import statistics
+import time
+from startup_benchmark import serve_fixtures
+
+async def measure_profile(playwright, name: str, base_url: str, runs: int, selector: str):
+    """Launch one profile, load the fixture page repeatedly and report its costs"""
+    from config import Config
+    from core.browser_pool import measure_child_rss_mb
+    from core.browser_profiles import resolve_profile, launch_options, context_options
+    
+    _, profile = resolve_profile(name)
+    baseline_mb = await asyncio.to_thread(measure_child_rss_mb)
+    
+    start_time = time.perf_counter()
+    try:
+        browser = await getattr(playwright, profile.get("engine", "chromium")).launch(**launch_options(profile))
+    except Exception as e:
+        print(f"{name:<12} skipped: {str(e).splitlines()[0]}")
+        return
+    launch_ms = (time.perf_counter() - start_time) * 1000
+    
+    try:
+        context = await browser.new_context(**context_options(profile))
+        page = await context.new_page()
+        page.set_default_timeout(Config.BROWSER_TIMEOUT)
+        
+        timings = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            await page.goto(f"{base_url}/index.html", wait_until="domcontentloaded")
+            timings.append((time.perf_counter() - start_time) * 1000)
+        
+        # Whether the profile can still do the workload (e.g. with JavaScript off)
+        element = await page.query_selector(selector)
+        works = element is not None and bool((await element.inner_text()).strip())
+        
+        rss_mb = await asyncio.to_thread(measure_child_rss_mb)
+        memory = f"{rss_mb - (baseline_mb or 0):.0f}MB" if rss_mb is not None else "n/a"
+        print(
+            f"{name:<12} launch {launch_ms:6.0f}ms  first load {timings[0]:6.0f}ms  "
+            f"median load {statistics.median(timings):6.0f}ms  memory {memory:>7}  works {'yes' if works else 'no'}"
+        )
+        await context.close()
+    finally:
+        await browser.close()
+
+async def run_benchmark(profiles, base_url: str, runs: int, selector: str):
+    """Benchmark the profiles one at a time so their memory does not overlap"""
+    from playwright.async_api import async_playwright
+    
+    async with async_playwright() as playwright:
+        for name in profiles:
+            await measure_profile(playwright, name, base_url, runs, selector)
+
+def main():
+    """Run the browser profile benchmark"""
+    from config import Config
+    
+    parser = argparse.ArgumentParser(description="Compare browser launch profiles on local fixtures")
+    parser.add_argument("--profiles", default=",".join(Config.BROWSER_PROFILES), help="Comma-separated profile names")
+    parser.add_argument("--runs", type=int, default=10, help="Page loads per profile")
+    parser.add_argument("--selector", default="h1", help="Element the workload needs; checks the profile still works")
+    args = parser.parse_args()
+    
+    profiles = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    unknown = [name for name in profiles if name not in Config.BROWSER_PROFILES]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)}")
+    
+    server, base_url = serve_fixtures()
+    try:
+        asyncio.run(run_benchmark(profiles, base_url, args.runs, args.selector))
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
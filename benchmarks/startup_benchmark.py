@@ -0,0 +1,97 @@
+"""
+Startup Benchmark - Measure API import time and time to first successful task
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import asyncio
+import functools
+import statistics
+import subprocess
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import api.main
+elapsed = time.perf_counter() - start
+heavy = [name for name in ("openai", "httpx", "playwright") if name in sys.modules]
+print(f"{elapsed:.4f} {','.join(heavy)}")
+"""
+
+def serve_fixtures():
+    """Serve the fixture pages on a local port, returning the server and base URL"""
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=FIXTURES_DIR)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def measure_import(runs: int):
+    """Import api.main in fresh interpreters and report timings"""
+    timings = []
+    heavy = ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=PROJECT_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        heavy = output[1] if len(output) > 1 else ""
+    
+    print(f"Import api.main: median {statistics.median(timings) * 1000:.0f}ms, min {min(timings) * 1000:.0f}ms over {runs} runs")
+    print(f"Heavy modules loaded at import: {heavy or 'none'}")
+
+async def measure_first_task(base_url: str, warmup: bool):
+    """Time from process start-up work to the first successful task"""
+    from config import Config
+    
+    start_time = time.perf_counter()
+    from core.task_executor import TaskExecutor
+    from core.browser_pool import browser_pool
+    
+    if warmup:
+        Config.BROWSER_REUSE = True
+        await browser_pool.get_browser()
+        ready_time = time.perf_counter()
+        print(f"Warm-up (browser pre-launch): {(ready_time - start_time) * 1000:.0f}ms")
+    else:
+        ready_time = start_time
+    
+    result = await TaskExecutor().execute_task({
+        "url": f"{base_url}/index.html",
+        "steps": [{"action": "get_text", "selector": "h1"}]
+    })
+    done_time = time.perf_counter()
+    await browser_pool.close()
+    
+    status = "succeeded" if result["success"] else f"failed ({result.get('error')})"
+    print(f"First task {status}: {(done_time - ready_time) * 1000:.0f}ms after ready, {(done_time - start_time) * 1000:.0f}ms total")
+
+def main():
+    """Run the startup benchmark"""
+    parser = argparse.ArgumentParser(description="Measure API cold-start cost")
+    parser.add_argument("--runs", type=int, default=5, help="Number of import measurements")
+    parser.add_argument("--warmup", action="store_true", help="Pre-launch the shared browser before the first task")
+    args = parser.parse_args()
+    
+    measure_import(args.runs)
+    
+    server, base_url = serve_fixtures()
+    try:
+        asyncio.run(measure_first_task(base_url, args.warmup))
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
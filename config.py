@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -6,6 +7,25 @@ load_dotenv()
 class Config:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+    # Models tried in order, from fastest/cheapest to strongest
+    LLM_MODEL_TIERS = [
+        model.strip()
+        for model in os.getenv("LLM_MODEL_TIERS", "gpt-3.5-turbo,gpt-4").split(",")
+        if model.strip()
+    ]
+    # USD per 1K prompt/completion tokens, used to estimate LLM cost
+    LLM_PRICES = os.getenv("LLM_PRICES", "gpt-3.5-turbo=0.0005/0.0015,gpt-4=0.03/0.06")
+    # Per-tenant token budgets over LLM_BUDGET_WINDOW seconds (0 = unlimited):
+    # past the soft budget AI tasks use only the cheapest tier, past the max they are rejected
+    LLM_TENANT_SOFT_TOKENS = int(os.getenv("LLM_TENANT_SOFT_TOKENS", "0"))
+    LLM_TENANT_MAX_TOKENS = int(os.getenv("LLM_TENANT_MAX_TOKENS", "0"))
+    LLM_BUDGET_WINDOW = int(os.getenv("LLM_BUDGET_WINDOW", "86400"))
+    # Plan templates matched offline against goals, skipping the LLM on a confident match
+    TEMPLATE_LIBRARY_ENABLED = os.getenv("TEMPLATE_LIBRARY_ENABLED", "true").lower() == "true"
+    TEMPLATE_LIBRARY_PATH = os.getenv("TEMPLATE_LIBRARY_PATH", "plan_templates.json")
+    TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.8"))
+    TEMPLATE_CURATED_THRESHOLD = float(os.getenv("TEMPLATE_CURATED_THRESHOLD", "0.95"))
+    TEMPLATE_LIBRARY_MAX = int(os.getenv("TEMPLATE_LIBRARY_MAX", "1000"))
     
     # MCP Server Configuration
     MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:3000")
@@ -13,10 +33,111 @@ class Config:
     # Browser Configuration
     BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "true").lower() == "true"
     BROWSER_TIMEOUT = int(os.getenv("BROWSER_TIMEOUT", "30000"))
+    # Reuse one launched browser across tasks (each task still gets a fresh context)
+    BROWSER_REUSE = os.getenv("BROWSER_REUSE", "false").lower() == "true"
+    # Shared browser recycling (only applies with BROWSER_REUSE); 0 disables a limit
+    BROWSER_RECYCLE_TASKS = int(os.getenv("BROWSER_RECYCLE_TASKS", "500"))
+    BROWSER_RECYCLE_RSS_MB = int(os.getenv("BROWSER_RECYCLE_RSS_MB", "2048"))
+    BROWSER_WATCHDOG_INTERVAL = float(os.getenv("BROWSER_WATCHDOG_INTERVAL", "30"))  # Seconds
+    BROWSER_PING_TIMEOUT = float(os.getenv("BROWSER_PING_TIMEOUT", "10"))
+    BROWSER_DRAIN_TIMEOUT = float(os.getenv("BROWSER_DRAIN_TIMEOUT", "120"))
+    # Named launch profiles (engine, launch args, viewport, locale, JavaScript), selectable per task with "browser_profile"
+    BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "default")
+    BROWSER_PROFILES = {
+        "default": {"engine": "chromium"},
+        "lean": {
+            "engine": "chromium",
+            "args": ["--disable-gpu", "--disable-extensions", "--disable-dev-shm-usage"],
+            "viewport": {"width": 1280, "height": 720}
+        },
+        "low_memory": {
+            "engine": "chromium",
+            "args": [
+                "--disable-gpu", "--disable-extensions", "--disable-dev-shm-usage",
+                "--disable-background-networking", "--disable-component-update", "--disable-sync",
+                "--no-first-run", "--mute-audio", "--renderer-process-limit=2",
+                "--js-flags=--max-old-space-size=256"
+            ],
+            "viewport": {"width": 1024, "height": 768}
+        },
+        "no_js": {
+            "engine": "chromium",
+            "args": ["--disable-gpu", "--disable-extensions", "--disable-dev-shm-usage"],
+            "viewport": {"width": 1024, "height": 768},
+            "java_script_enabled": False
+        },
+        "firefox": {"engine": "firefox", "viewport": {"width": 1280, "height": 720}},
+        "webkit": {"engine": "webkit", "viewport": {"width": 1280, "height": 720}}
+    }
+    # Extra or overriding profiles as a JSON object, e.g. {"mobile": {"engine": "webkit", "viewport": {"width": 390, "height": 844}}}
+    BROWSER_PROFILES.update(json.loads(os.getenv("BROWSER_PROFILES_JSON", "{}")))
+    # Extra tabs a task may have open at once when running steps in parallel (0 means unlimited)
+    MAX_TABS_PER_TASK = int(os.getenv("MAX_TABS_PER_TASK", "4"))
+    
+    # HTTP-only fast path for tasks that only wait for and read elements
+    TASK_MODE = os.getenv("TASK_MODE", "browser")  # browser, static or auto
+    STATIC_FETCH_TIMEOUT = int(os.getenv("STATIC_FETCH_TIMEOUT", "15000"))  # ms
+    STATIC_MAX_CONNECTIONS = int(os.getenv("STATIC_MAX_CONNECTIONS", "100"))
+    STATIC_USER_AGENT = os.getenv(
+        "STATIC_USER_AGENT",
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    )
+    
+    # Identical read-only tasks share one run; successful results are reused for RESULT_CACHE_TTL seconds
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "10"))
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+    
+    # Admission Control (API requests beyond the caps wait in a bounded queue, then get 429; 0 disables a cap)
+    ADMISSION_MAX_BROWSER_SESSIONS = int(os.getenv("ADMISSION_MAX_BROWSER_SESSIONS", "8"))
+    ADMISSION_MAX_AI_TASKS = int(os.getenv("ADMISSION_MAX_AI_TASKS", "4"))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+    
+    # Asset Cache Configuration (static JS/CSS/fonts/images shared across contexts)
+    ASSET_CACHE_ENABLED = os.getenv("ASSET_CACHE_ENABLED", "false").lower() == "true"
+    ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", ".asset_cache")
+    ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+    
+    # DOM snapshots used for browserless dry-run validation of plans
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+    
+    # Scheduler Configuration (per-domain politeness for concurrent tasks)
+    SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "10"))
+    SCHEDULER_DOMAIN_CONCURRENCY = int(os.getenv("SCHEDULER_DOMAIN_CONCURRENCY", "2"))
+    SCHEDULER_DOMAIN_RATE = float(os.getenv("SCHEDULER_DOMAIN_RATE", "1.0"))  # Requests per second
+    SCHEDULER_DOMAIN_BURST = int(os.getenv("SCHEDULER_DOMAIN_BURST", "2"))
+    SCHEDULER_BACKOFF_BASE = float(os.getenv("SCHEDULER_BACKOFF_BASE", "5.0"))  # Seconds
+    SCHEDULER_BACKOFF_MAX = float(os.getenv("SCHEDULER_BACKOFF_MAX", "120.0"))
+    SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "2"))
+    
+    # Recurring tasks keep their last extracted values here to emit only changes
+    RECURRING_STATE_PATH = os.getenv("RECURRING_STATE_PATH", "recurring_state.json")
+    RECURRING_JOBS_PATH = os.getenv("RECURRING_JOBS_PATH", "")  # JSON list of jobs the API runs; empty disables
+    RECURRING_WEBHOOK_URL = os.getenv("RECURRING_WEBHOOK_URL", "")  # Change events are POSTed here when set
+    
+    # Trace Configuration (Playwright trace/HAR capture, off by default)
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.0"))  # Fraction of tasks traced, e.g. 0.01
+    TRACE_ON_FAILURE = os.getenv("TRACE_ON_FAILURE", "false").lower() == "true"
+    TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", "0"))  # Keep traces of tasks slower than this (0 disables)
+    TRACE_HAR = os.getenv("TRACE_HAR", "false").lower() == "true"
+    TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+    TRACE_MAX_ARTIFACTS = int(os.getenv("TRACE_MAX_ARTIFACTS", "100"))
+    
+    # On-demand profiling of single task runs (X-Profile header or "profile" task flag)
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_MAX_ARTIFACTS = int(os.getenv("PROFILE_MAX_ARTIFACTS", "50"))
+    
+    # Screenshot Change Detection (steps with a change_key are only written when the page looks different)
+    SCREENSHOT_HASH_PATH = os.getenv("SCREENSHOT_HASH_PATH", "screenshot_hashes.json")
+    SCREENSHOT_CHANGE_THRESHOLD = int(os.getenv("SCREENSHOT_CHANGE_THRESHOLD", "5"))  # Differing bits out of 64
     
     # API Configuration
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
     API_PORT = int(os.getenv("API_PORT", "8000"))
+    # Load the AI stack and launch the shared browser before reporting ready
+    API_WARMUP = os.getenv("API_WARMUP", "false").lower() == "true"
     
     # Logging Configuration
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json or text
+    # Fraction of success-path step/action logs kept; warnings and errors are always logged
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))
@@ -0,0 +1,131 @@
+"""Admission control: caps on concurrent browser and AI work, a bounded wait queue and priority lanes"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Waiters in earlier lanes are admitted first
+LANES = ("interactive", "bulk")
+
+class AdmissionRejected(Exception):
+    """Raised when a resource's wait queue is full"""
+    
+    def __init__(self, resource: str, retry_after: int):
+        super().__init__(f"Too many {resource} requests queued, retry after {retry_after}s")
+        self.resource = resource
+        self.retry_after = retry_after
+
+def lane_for(priority: Optional[str]) -> str:
+    """Lane named by an X-Priority header value; anything but bulk is interactive"""
+    return "bulk" if (priority or "").strip().lower() == "bulk" else "interactive"
+
+class Limiter:
+    """Counting semaphore whose waiters are admitted by lane, then in arrival order"""
+    
+    def __init__(self, name: str, capacity: int, max_queue: int):
+        self.name = name
+        self.capacity = capacity  # 0 means unlimited
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []  # Heap of (lane rank, arrival, future)
+        self._arrivals = itertools.count()
+        self.admitted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+        self.avg_hold = 1.0  # Moving average of seconds a slot is held, for Retry-After
+    
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        """Waiters still queued, optionally in one lane"""
+        rank = LANES.index(lane) if lane else None
+        return sum(1 for waiter_rank, _, future in self.waiters if not future.done() and rank in (None, waiter_rank))
+    
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request is likely to have drained"""
+        slots = self.capacity or 1
+        return max(1, math.ceil(self.avg_hold * (self.queue_depth() + 1) / slots))
+    
+    async def acquire(self, lane: str = "interactive", bounded: bool = True):
+        """Take a slot, waiting behind earlier lanes; bounded requests are rejected when the queue is full"""
+        if not self.capacity or (self.active < self.capacity and not self.queue_depth()):
+            self.active += 1
+            self.admitted[lane] += 1
+            return
+        
+        # Unbounded waiters (batch tasks) are already queued by the scheduler and never rejected
+        if bounded and self.queue_depth() >= self.max_queue:
+            self.rejected[lane] += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (LANES.index(lane), next(self._arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation landed
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self.admitted[lane] += 1
+    
+    def release(self, held: Optional[float] = None):
+        """Hand the slot to the best waiter, or free it"""
+        if held is not None:
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held
+        while self.capacity and self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)  # The slot passes on, so active stays the same
+                return
+        self.active -= 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Slot usage, queue depth per lane and admission counts"""
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "queued": {lane: self.queue_depth(lane) for lane in LANES},
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "retry_after": self.retry_after()
+        }
+
+class AdmissionController:
+    """Limiters for browser sessions and AI tasks shared by all API requests"""
+    
+    def __init__(
+        self,
+        max_browser_sessions: int = Config.ADMISSION_MAX_BROWSER_SESSIONS,
+        max_ai_tasks: int = Config.ADMISSION_MAX_AI_TASKS,
+        max_queue: int = Config.ADMISSION_MAX_QUEUE
+    ):
+        self.limiters = {
+            "browser": Limiter("browser", max_browser_sessions, max_queue),
+            "ai": Limiter("ai", max_ai_tasks, max_queue)
+        }
+    
+    @asynccontextmanager
+    async def admit(self, resource: str, lane: str = "interactive", bounded: bool = True):
+        """Hold a slot of a resource for the duration of the block"""
+        limiter = self.limiters[resource]
+        try:
+            await limiter.acquire(lane, bounded)
+        except AdmissionRejected as e:
+            logger.warning("Rejected %s request in %s lane, retry after %ss", resource, lane, e.retry_after)
+            raise
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            limiter.release(time.monotonic() - start_time)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Stats of every limiter"""
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
+
+admission = AdmissionController()
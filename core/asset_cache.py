@@ -0,0 +1,191 @@
+"""Shared on-disk cache for static assets, served through Playwright route interception"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_RESOURCE_TYPES = {"script", "stylesheet", "font", "image"}
+
+# Headers describing the original transfer, not the decoded body we store
+_TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*(\d+)", re.IGNORECASE)
+
+def parse_max_age(headers: Dict[str, str]) -> Optional[int]:
+    """Get the freshness lifetime in seconds from Cache-Control, or None if not cacheable"""
+    cache_control = headers.get("cache-control", "").lower()
+    if not cache_control or any(token in cache_control for token in ("no-store", "no-cache", "private")):
+        return None
+    matches = [int(value) for value in _MAX_AGE.findall(cache_control)]
+    if not matches or max(matches) <= 0:
+        return None
+    return max(matches)
+
+class AssetCache:
+    """Size-bounded LRU store of cacheable static responses shared across browser contexts"""
+    
+    def __init__(self, cache_dir: str = Config.ASSET_CACHE_DIR, max_bytes: int = Config.ASSET_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+    
+    def _load_index(self):
+        """Load cache entries persisted by earlier runs"""
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        
+        for key, entry in entries:
+            if os.path.exists(self._file_path(key)):
+                self.entries[key] = entry
+                self.total_bytes += entry["size"]
+    
+    def _save_index(self):
+        """Persist entries in LRU order (caller holds the lock)"""
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(temp_path, self.index_path)
+    
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+    
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+    
+    def get(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """Get a fresh cached response, or None"""
+        key = self._key(url)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] <= time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+        
+        try:
+            with open(self._file_path(key), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(key)
+            return None
+        return entry["status"], entry["headers"], body
+    
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes, max_age: int):
+        """Store a response, evicting least recently used entries to stay under max_bytes"""
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        
+        key = self._key(url)
+        with open(self._file_path(key), "wb") as f:
+            f.write(body)
+        
+        stored_headers = {name: value for name, value in headers.items() if name.lower() not in _TRANSFER_HEADERS}
+        with self._lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)["size"]
+            self.entries[key] = {
+                "status": status,
+                "headers": stored_headers,
+                "size": size,
+                "expires": time.time() + max_age
+            }
+            self.total_bytes += size
+            
+            while self.total_bytes > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+            self._save_index()
+    
+    def _remove(self, key: str):
+        """Drop an entry and its file (caller holds the lock)"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["size"]
+        try:
+            os.remove(self._file_path(key))
+        except FileNotFoundError:
+            pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get hit ratio and size of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+    
+    def route_handler(self, counters: Dict[str, int]):
+        """Create a Playwright route handler that also counts hits and misses for one task"""
+        
+        async def handle(route):
+            request = route.request
+            if request.method != "GET" or request.resource_type not in CACHEABLE_RESOURCE_TYPES:
+                await route.continue_()
+                return
+            
+            cached = await asyncio.to_thread(self.get, request.url)
+            if cached:
+                self.hits += 1
+                counters["hits"] = counters.get("hits", 0) + 1
+                status, headers, body = cached
+                await route.fulfill(status=status, headers=headers, body=body)
+                return
+            
+            self.misses += 1
+            counters["misses"] = counters.get("misses", 0) + 1
+            try:
+                response = await route.fetch()
+                body = await response.body()
+            except Exception as e:
+                logger.debug(f"Asset fetch failed, continuing normally: {e}")
+                await route.continue_()
+                return
+            
+            max_age = parse_max_age(response.headers)
+            if response.status == 200 and max_age:
+                await asyncio.to_thread(self.put, request.url, response.status, response.headers, body, max_age)
+            await route.fulfill(response=response, body=body)
+        
+        return handle
+
+_asset_cache: Optional[AssetCache] = None
+
+def get_asset_cache() -> AssetCache:
+    """Get the process-wide asset cache shared by all browser contexts"""
+    global _asset_cache
+    if _asset_cache is None:
+        _asset_cache = AssetCache()
+    return _asset_cache
+
+def get_asset_cache_stats() -> Optional[Dict[str, Any]]:
+    """Get stats of the shared asset cache, or None if no task has used it"""
+    return _asset_cache.stats() if _asset_cache else None
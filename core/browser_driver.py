@@ -1,8 +1,13 @@
 import asyncio
 import logging
-from typing import Optional
-from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from typing import Dict, Optional, TYPE_CHECKING
 from config import Config
+from core.browser_pool import BrowserPool, get_browser_pool
+from core.browser_profiles import resolve_profile, launch_options, context_options
+from core.logging_config import SAMPLED
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, BrowserContext, Page
 
 logger = logging.getLogger(__name__)
 
@@ -11,18 +16,39 @@ class BrowserDriver:
     
     def __init__(self):
         self.playwright = None
-        self.browser: Optional[Browser] = None
-        self.context: Optional[BrowserContext] = None
-        self.page: Optional[Page] = None
+        self.browser: Optional["Browser"] = None
+        self.context: Optional["BrowserContext"] = None
+        self.page: Optional["Page"] = None
+        self.last_status: Optional[int] = None  # Of the main page, for rate-limit backoff
+        self.statuses: Dict["Page", Optional[int]] = {}  # Last response status per open page
+        self.owns_browser = True
+        self.pool: Optional[BrowserPool] = None
     
-    async def start(self):
-        """Start browser"""
+    async def start(self, trace: bool = False, har_path: Optional[str] = None, route_handler=None, profile: Optional[str] = None):
+        """Start browser with a launch profile, optionally recording a Playwright trace and HAR and routing requests through a handler"""
         try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=Config.BROWSER_HEADLESS
-            )
-            self.context = await self.browser.new_context()
+            name, settings = resolve_profile(profile)
+            if Config.BROWSER_REUSE:
+                self.pool = get_browser_pool(name)
+                self.browser = await self.pool.acquire()
+                self.owns_browser = False
+            else:
+                # Imported here so scripted-only workers don't load Playwright until needed
+                from playwright.async_api import async_playwright
+                
+                self.playwright = await async_playwright().start()
+                engine = getattr(self.playwright, settings.get("engine", "chromium"))
+                self.browser = await engine.launch(**launch_options(settings))
+                self.owns_browser = True
+            options = context_options(settings)
+            if har_path:
+                # HAR recording must be configured when the context is created
+                options.update(record_har_path=har_path, record_har_content="omit")
+            self.context = await self.browser.new_context(**options)
+            if trace:
+                await self.context.tracing.start(screenshots=True, snapshots=True)
+            if route_handler:
+                await self.context.route("**/*", route_handler)
             self.page = await self.context.new_page()
             
             # Set timeout
@@ -31,104 +57,210 @@ class BrowserDriver:
             logger.info("Browser started successfully")
             return True
         except Exception as e:
-            logger.error(f"Failed to start browser: {e}")
+            logger.error("Failed to start browser: %s", e)
             return False
     
-    async def navigate_to(self, url: str) -> bool:
-        """Navigate to specified URL"""
+    async def navigate_to(self, url: str, page: Optional["Page"] = None, timeout: Optional[int] = None) -> bool:
+        """Navigate to specified URL; timeout caps both the load and the fallback wait"""
         try:
-            if not self.page:
+            page = page or self.page
+            if not page:
                 raise Exception("Page not initialized")
             
+            self.statuses[page] = None
+            if page is self.page:
+                self.last_status = None
             # Use domcontentloaded instead of networkidle to avoid timeout
-            await self.page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            logger.info(f"Successfully navigated to: {url}")
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=min(60000, timeout or 60000))
+            self.statuses[page] = response.status if response else None
+            if page is self.page:
+                self.last_status = self.statuses[page]
+            logger.info("Successfully navigated to: %s", url, extra=SAMPLED)
             return True
         except Exception as e:
-            logger.error(f"Navigation failed: {e}")
+            logger.error("Navigation failed: %s", e)
             # Even if timeout, try to continue execution
             try:
-                await self.page.wait_for_load_state("domcontentloaded", timeout=10000)
-                logger.info("Page loaded successfully")
+                await page.wait_for_load_state("domcontentloaded", timeout=min(10000, timeout or 10000))
+                logger.info("Page loaded successfully", extra=SAMPLED)
                 return True
             except:
                 pass
             return False
     
-    async def click_element(self, selector: str) -> bool:
+    async def click_element(self, selector: str, page: Optional["Page"] = None, timeout: Optional[int] = None) -> bool:
         """Click element"""
         try:
-            if not self.page:
+            page = page or self.page
+            if not page:
                 raise Exception("Page not initialized")
             
-            await self.page.click(selector)
-            logger.info(f"Successfully clicked element: {selector}")
+            await page.click(selector, timeout=timeout)
+            logger.info("Successfully clicked element: %s", selector, extra=SAMPLED)
             return True
         except Exception as e:
-            logger.error(f"Failed to click element: {e}")
+            logger.error("Failed to click element: %s", e)
             return False
     
-    async def type_text(self, selector: str, text: str) -> bool:
+    async def type_text(self, selector: str, text: str, page: Optional["Page"] = None, timeout: Optional[int] = None) -> bool:
         """Type text"""
         try:
-            if not self.page:
+            page = page or self.page
+            if not page:
                 raise Exception("Page not initialized")
             
-            await self.page.fill(selector, text)
-            logger.info(f"Successfully typed text to: {selector}")
+            await page.fill(selector, text, timeout=timeout)
+            logger.info("Successfully typed text to: %s", selector, extra=SAMPLED)
             return True
         except Exception as e:
-            logger.error(f"Failed to type text: {e}")
+            logger.error("Failed to type text: %s", e)
             return False
     
-    async def get_text(self, selector: str) -> Optional[str]:
+    async def get_text(self, selector: str, page: Optional["Page"] = None, timeout: Optional[int] = None) -> Optional[str]:
         """Get element text"""
         try:
-            if not self.page:
+            page = page or self.page
+            if not page:
                 raise Exception("Page not initialized")
             
-            text = await self.page.text_content(selector)
-            logger.info(f"Successfully got text from: {selector}")
+            text = await page.text_content(selector, timeout=timeout)
+            logger.info("Successfully got text from: %s", selector, extra=SAMPLED)
             return text
         except Exception as e:
-            logger.error(f"Failed to get text: {e}")
+            logger.error("Failed to get text: %s", e)
             return None
     
-    async def wait_for_element(self, selector: str, timeout: int = 5000) -> bool:
+    async def wait_for_element(self, selector: str, timeout: int = 5000, page: Optional["Page"] = None) -> bool:
         """Wait for element to appear"""
         try:
-            if not self.page:
+            page = page or self.page
+            if not page:
                 raise Exception("Page not initialized")
             
-            await self.page.wait_for_selector(selector, timeout=timeout)
-            logger.info(f"Element appeared: {selector}")
+            await page.wait_for_selector(selector, timeout=timeout)
+            logger.info("Element appeared: %s", selector, extra=SAMPLED)
             return True
         except Exception as e:
-            logger.error(f"Wait for element timeout: {e}")
+            logger.error("Wait for element timeout: %s", e)
             return False
     
-    async def take_screenshot(self, path: str = "screenshot.png") -> bool:
-        """Take screenshot"""
+    async def wait_for_load(self, page: Optional["Page"] = None, timeout: Optional[int] = None) -> bool:
+        """Wait for the document (e.g. one opened by a click) to finish loading"""
+        try:
+            page = page or self.page
+            if not page:
+                raise Exception("Page not initialized")
+            
+            await page.wait_for_load_state("domcontentloaded", timeout=timeout)
+            return True
+        except Exception as e:
+            logger.error("Wait for page load failed: %s", e)
+            return False
+    
+    async def new_page(self) -> Optional["Page"]:
+        """Open an additional tab in the current context"""
+        try:
+            if not self.context:
+                raise Exception("Context not initialized")
+            
+            page = await self.context.new_page()
+            page.set_default_timeout(Config.BROWSER_TIMEOUT)
+            return page
+        except Exception as e:
+            logger.error("Failed to open new page: %s", e)
+            return None
+    
+    def status_of(self, page: Optional["Page"] = None) -> Optional[int]:
+        """Response status of the last navigation of a page (the main page by default)"""
+        return self.statuses.get(page or self.page)
+    
+    async def close_page(self, page: "Page"):
+        """Close an additional tab"""
+        self.statuses.pop(page, None)
+        try:
+            await page.close()
+        except Exception as e:
+            logger.error("Failed to close page: %s", e)
+    
+    async def get_content(self) -> Optional[str]:
+        """Get rendered page HTML"""
         try:
             if not self.page:
                 raise Exception("Page not initialized")
             
-            await self.page.screenshot(path=path)
-            logger.info(f"Screenshot saved to: {path}")
+            return await self.page.content()
+        except Exception as e:
+            logger.error("Failed to get page content: %s", e)
+            return None
+    
+    async def take_screenshot(self, path: str = "screenshot.png", page: Optional["Page"] = None, timeout: Optional[int] = None) -> bool:
+        """Take screenshot"""
+        try:
+            page = page or self.page
+            if not page:
+                raise Exception("Page not initialized")
+            
+            await page.screenshot(path=path, timeout=timeout)
+            logger.info("Screenshot saved to: %s", path, extra=SAMPLED)
             return True
         except Exception as e:
-            logger.error(f"Screenshot failed: {e}")
+            logger.error("Screenshot failed: %s", e)
             return False
     
+    async def capture_screenshot(self, page: Optional["Page"] = None, timeout: Optional[int] = None) -> Optional[bytes]:
+        """Take screenshot as PNG bytes without writing it"""
+        try:
+            page = page or self.page
+            if not page:
+                raise Exception("Page not initialized")
+            
+            return await page.screenshot(timeout=timeout)
+        except Exception as e:
+            logger.error("Screenshot failed: %s", e)
+            return None
+    
+    async def stop_tracing(self, path: Optional[str] = None):
+        """Stop tracing, saving the trace to path or discarding it"""
+        try:
+            if self.context:
+                if path:
+                    await self.context.tracing.stop(path=path)
+                    logger.info("Trace saved to: %s", path)
+                else:
+                    await self.context.tracing.stop()
+        except Exception as e:
+            logger.error("Failed to stop tracing: %s", e)
+    
+    def detach(self) -> "BrowserDriver":
+        """Hand the current browser session over to a new driver so it can be closed in the background"""
+        detached = BrowserDriver()
+        detached.playwright = self.playwright
+        detached.browser = self.browser
+        detached.context = self.context
+        detached.page = self.page
+        detached.owns_browser = self.owns_browser
+        detached.pool = self.pool
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+        return detached
+    
     async def close(self):
         """Close browser"""
         try:
             if self.context:
                 await self.context.close()
-            if self.browser:
-                await self.browser.close()
-            if self.playwright:
-                await self.playwright.stop()
+            if self.owns_browser:
+                if self.browser:
+                    await self.browser.close()
+                if self.playwright:
+                    await self.playwright.stop()
             logger.info("Browser closed")
         except Exception as e:
-            logger.error(f"Failed to close browser: {e}")
+            logger.error("Failed to close browser: %s", e)
+        finally:
+            # The lease must go back even if the context failed to close, or the pool never drains
+            if not self.owns_browser and self.browser:
+                browser, self.browser = self.browser, None
+                await self.pool.release(browser)
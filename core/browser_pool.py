@@ -0,0 +1,319 @@
+"""Shared browser process reused across tasks; each task still gets its own context"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional, Set, TYPE_CHECKING
+from config import Config
+from core.browser_profiles import resolve_profile, launch_options
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser
+
+logger = logging.getLogger(__name__)
+
+def _process_children() -> Dict[int, List[int]]:
+    """Child PIDs of every process, read from /proc"""
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", encoding="utf-8") as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+def _child_pids() -> Set[int]:
+    """PIDs of this process's direct children"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    
+    if psutil:
+        return {child.pid for child in psutil.Process().children()}
+    if not os.path.isdir("/proc"):
+        return set()
+    return set(_process_children().get(os.getpid(), []))
+
+def _descendant_pids(root_pid: int) -> List[int]:
+    """PIDs of all processes below root_pid, read from /proc"""
+    children = _process_children()
+    pids = []
+    stack = [root_pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            pids.append(child)
+            stack.append(child)
+    return pids
+
+def measure_tree_rss_mb(root_pid: int, include_root: bool = False) -> Optional[float]:
+    """Total RSS of the processes below root_pid (and root_pid itself if asked), in MB"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    
+    if psutil:
+        try:
+            root = psutil.Process(root_pid)
+            processes = root.children(recursive=True) + ([root] if include_root else [])
+        except psutil.Error:
+            return None
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+    
+    if not os.path.isdir("/proc"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in _descendant_pids(root_pid) + ([root_pid] if include_root else []):
+        try:
+            with open(f"/proc/{pid}/statm", encoding="utf-8") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024)
+
+def measure_child_rss_mb() -> Optional[float]:
+    """Total RSS of this process's children (every Playwright driver and browser), in MB"""
+    return measure_tree_rss_mb(os.getpid())
+
+# Serializes driver starts across pools so each pool can tell which new child process is its driver
+_driver_start_lock: Optional[asyncio.Lock] = None
+_driver_start_loop = None
+
+async def _start_playwright():
+    """Start a Playwright driver; returns it with the driver's PID, or None if it cannot be told apart"""
+    global _driver_start_lock, _driver_start_loop
+    from playwright.async_api import async_playwright
+    
+    loop = asyncio.get_running_loop()
+    if _driver_start_loop is not loop:
+        _driver_start_lock = asyncio.Lock()
+        _driver_start_loop = loop
+    
+    async with _driver_start_lock:
+        before = await asyncio.to_thread(_child_pids)
+        playwright = await async_playwright().start()
+        started = await asyncio.to_thread(_child_pids) - before
+    return playwright, started.pop() if len(started) == 1 else None
+
+class _PooledBrowser:
+    """A launched browser with its lease and task counters"""
+    
+    def __init__(self, browser: "Browser", generation: int):
+        self.browser = browser
+        self.generation = generation
+        self.leases = 0
+        self.tasks = 0
+        self.launched_at = time.monotonic()
+        self.closing = False
+
+class BrowserPool:
+    """Launches a shared browser of one launch profile lazily, hands it out to BrowserDriver instances and recycles it"""
+    
+    def __init__(self, profile: Optional[str] = None):
+        self.profile = profile  # None means BROWSER_PROFILE
+        self.playwright = None
+        self.driver_pid: Optional[int] = None  # Root of this pool's process tree: its driver and browsers
+        self.current: Optional[_PooledBrowser] = None
+        self.retiring: List[_PooledBrowser] = []
+        self.generation = 0
+        self.recycles = {"tasks": 0, "memory": 0, "unresponsive": 0}
+        self.last_rss_mb: Optional[float] = None
+        self.page_counts: List[int] = []
+        self._loop = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._watchdog: Optional[asyncio.Task] = None
+        self._closers = set()
+    
+    async def get_browser(self) -> "Browser":
+        """Get the shared browser, launching it on first use, after a recycle or after a disconnect"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Playwright objects belong to the loop that created them
+            self.playwright = None
+            self.driver_pid = None
+            self.current = None
+            self.retiring = []
+            self._watchdog = None
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        
+        async with self._lock:
+            if self.current is None or not self.current.browser.is_connected():
+                name, profile = resolve_profile(self.profile)
+                if self.playwright is None:
+                    self.playwright, self.driver_pid = await _start_playwright()
+                    if self.driver_pid is None:
+                        logger.warning("Cannot find the Playwright driver process; memory recycling is off for this pool")
+                engine = getattr(self.playwright, profile.get("engine", "chromium"))
+                browser = await engine.launch(**launch_options(profile))
+                self.generation += 1
+                self.current = _PooledBrowser(browser, self.generation)
+                logger.info(f"Shared {name} browser launched (generation {self.generation})")
+            
+            if self._watchdog is None and Config.BROWSER_WATCHDOG_INTERVAL > 0:
+                self._watchdog = asyncio.create_task(self._watch())
+            return self.current.browser
+    
+    async def acquire(self) -> "Browser":
+        """Lease the shared browser for one task"""
+        browser = await self.get_browser()
+        entry = self.current
+        entry.leases += 1
+        entry.tasks += 1
+        if Config.BROWSER_RECYCLE_TASKS > 0 and entry.tasks >= Config.BROWSER_RECYCLE_TASKS:
+            # This task is the last one the browser serves; it closes once drained
+            self._retire(entry, "tasks")
+        return browser
+    
+    async def release(self, browser: "Browser"):
+        """Return a lease; retired browsers close when their last task finishes"""
+        for entry in [self.current] + self.retiring:
+            if entry and entry.browser is browser:
+                entry.leases = max(0, entry.leases - 1)
+                if entry in self.retiring and entry.leases == 0:
+                    await self._close_entry(entry)
+                return
+    
+    def _retire(self, entry: _PooledBrowser, reason: str):
+        """Stop handing out a browser and close it after in-flight tasks drain"""
+        if entry is not self.current:
+            return
+        self.current = None
+        self.retiring.append(entry)
+        self.recycles[reason] += 1
+        logger.info(f"Recycling browser generation {entry.generation} ({reason}, {entry.tasks} tasks, {entry.leases} in flight)")
+        
+        closer = asyncio.create_task(self._drain_and_close(entry))
+        self._closers.add(closer)
+        closer.add_done_callback(self._closers.discard)
+    
+    async def _drain_and_close(self, entry: _PooledBrowser):
+        """Wait for leases to finish (up to the drain timeout), then close the browser"""
+        deadline = time.monotonic() + Config.BROWSER_DRAIN_TIMEOUT
+        while entry.leases > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        if entry.leases > 0:
+            logger.warning(f"Closing browser generation {entry.generation} with {entry.leases} tasks still running")
+        await self._close_entry(entry)
+    
+    async def _close_entry(self, entry: _PooledBrowser):
+        """Close a retired browser once"""
+        if entry.closing:
+            return
+        entry.closing = True
+        try:
+            await entry.browser.close()
+        except Exception as e:
+            logger.error(f"Failed to close recycled browser: {e}")
+        finally:
+            if entry in self.retiring:
+                self.retiring.remove(entry)
+    
+    async def _watch(self):
+        """Periodically sample memory and responsiveness, recycling the browser when limits are hit"""
+        while True:
+            await asyncio.sleep(Config.BROWSER_WATCHDOG_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Browser watchdog check failed: {e}")
+    
+    async def check(self):
+        """Run one watchdog check"""
+        # Only this pool's own driver and browsers count, so a heavy profile does not recycle the others
+        if self.driver_pid is not None:
+            self.last_rss_mb = await asyncio.to_thread(measure_tree_rss_mb, self.driver_pid, True)
+        
+        entry = self.current
+        if entry is None:
+            return
+        self.page_counts = [len(context.pages) for context in entry.browser.contexts]
+        
+        # The driver tree still holds draining browsers, so their memory would be charged to the new one
+        if (
+            Config.BROWSER_RECYCLE_RSS_MB > 0 and not self.retiring
+            and self.last_rss_mb and self.last_rss_mb >= Config.BROWSER_RECYCLE_RSS_MB
+        ):
+            self._retire(entry, "memory")
+            return
+        
+        try:
+            # A context round trip proves the browser still answers commands
+            context = await asyncio.wait_for(entry.browser.new_context(), timeout=Config.BROWSER_PING_TIMEOUT)
+            await context.close()
+        except Exception as e:
+            logger.warning(f"Browser generation {entry.generation} is not responding: {e}")
+            self._retire(entry, "unresponsive")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get recycle counts, memory level and load of the shared browser"""
+        entry = self.current
+        return {
+            "generation": self.generation,
+            "active_tasks": entry.leases if entry else 0,
+            "tasks_served": entry.tasks if entry else 0,
+            "uptime": time.monotonic() - entry.launched_at if entry else 0.0,
+            "context_page_counts": self.page_counts,
+            "retiring": len(self.retiring),
+            "rss_mb": self.last_rss_mb,
+            "recycles": dict(self.recycles)
+        }
+    
+    async def close(self):
+        """Close the shared browser"""
+        if self._watchdog:
+            self._watchdog.cancel()
+            self._watchdog = None
+        try:
+            for entry in [self.current] + self.retiring:
+                if entry and not entry.closing:
+                    entry.closing = True
+                    await entry.browser.close()
+            if self.playwright:
+                await self.playwright.stop()
+            logger.info("Shared browser closed")
+        except Exception as e:
+            logger.error(f"Failed to close shared browser: {e}")
+        finally:
+            self.current = None
+            self.retiring = []
+            self.playwright = None
+            self.driver_pid = None
+
+browser_pool = BrowserPool()
+
+# Pools of profiles other than BROWSER_PROFILE, created on first use
+_profile_pools: Dict[str, BrowserPool] = {}
+
+def get_browser_pool(profile: Optional[str] = None) -> BrowserPool:
+    """Get the shared pool for a launch profile"""
+    if not profile or profile == Config.BROWSER_PROFILE:
+        return browser_pool
+    if profile not in _profile_pools:
+        _profile_pools[profile] = BrowserPool(profile)
+    return _profile_pools[profile]
+
+def get_browser_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every pool in use, keyed by profile"""
+    stats = {Config.BROWSER_PROFILE: browser_pool.get_stats()}
+    stats.update({profile: pool.get_stats() for profile, pool in _profile_pools.items()})
+    return stats
+
+async def close_browser_pools():
+    """Close the shared browsers of all profiles"""
+    await browser_pool.close()
+    for pool in _profile_pools.values():
+        await pool.close()
@@ -0,0 +1,29 @@
+"""Named browser launch profiles: engine, launch arguments and context settings"""
+from typing import Dict, Any, Optional, Tuple
+from config import Config
+
+ENGINES = ("chromium", "firefox", "webkit")
+
+# Profile keys passed to browser.new_context()
+CONTEXT_OPTIONS = ("viewport", "locale", "timezone_id", "user_agent", "java_script_enabled")
+
+def resolve_profile(name: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Name and settings of a launch profile (BROWSER_PROFILE by default)"""
+    name = name or Config.BROWSER_PROFILE
+    profile = Config.BROWSER_PROFILES.get(name)
+    if profile is None:
+        raise ValueError(f"Unknown browser profile: {name}")
+    if profile.get("engine", "chromium") not in ENGINES:
+        raise ValueError(f"Browser profile {name} has unsupported engine {profile.get('engine')}")
+    return name, profile
+
+def launch_options(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Keyword arguments for the engine's launch()"""
+    options = {"headless": Config.BROWSER_HEADLESS}
+    if profile.get("args"):
+        options["args"] = list(profile["args"])
+    return options
+
+def context_options(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Keyword arguments for new_context()"""
+    return {key: profile[key] for key in CONTEXT_OPTIONS if key in profile}
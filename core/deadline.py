@@ -0,0 +1,38 @@
+"""Task-level deadline budgets shared by every phase of a task"""
+import time
+from typing import Optional
+
+class Deadline:
+    """Time budget for a whole task; each phase caps its own timeout by what remains"""
+    
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000 if budget_ms is not None else None
+    
+    @property
+    def unlimited(self) -> bool:
+        return self.expires_at is None
+    
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+    
+    def remaining_ms(self) -> Optional[float]:
+        """Milliseconds left, or None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, (self.expires_at - time.monotonic()) * 1000)
+    
+    def remaining_seconds(self) -> Optional[float]:
+        """Seconds left, or None without a deadline"""
+        remaining = self.remaining_ms()
+        return None if remaining is None else remaining / 1000
+    
+    def cap(self, timeout_ms: Optional[float]) -> Optional[int]:
+        """The smaller of a phase's own timeout and the remaining budget (at least 1ms)"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return None if timeout_ms is None else int(timeout_ms)
+        if timeout_ms is None:
+            return max(1, int(remaining))
+        return max(1, int(min(timeout_ms, remaining)))
@@ -0,0 +1,176 @@
+"""Browserless dry-run validation of plans against captured DOM snapshots"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import AsyncContextManager, Callable, Dict, Any, List, Optional
+from selectolax.lexbor import LexborHTMLParser
+from config import Config
+from core.browser_driver import BrowserDriver
+
+logger = logging.getLogger(__name__)
+
+KNOWN_ACTIONS = {"wait", "click", "type", "get_text", "screenshot", "goto"}
+EDITABLE_TAGS = {"input", "textarea", "select"}
+
+# Playwright selector engines that a CSS parser cannot evaluate
+_PLAYWRIGHT_PREFIXES = ("text=", "xpath=", "id=", "role=", "data-testid=", "internal:", "//", "..")
+_PLAYWRIGHT_PSEUDOS = (":has-text(", ":text(", ":text-is(", ":text-matches(", ":visible", ":nth-match(", ":left-of(", ":right-of(", ":above(", ":below(", ":near(")
+
+def to_css(selector: str) -> Optional[str]:
+    """Plain CSS form of a selector, or None if it needs Playwright's selector engines"""
+    css = selector[4:] if selector.startswith("css=") else selector
+    if css.startswith(_PLAYWRIGHT_PREFIXES) or ">>" in css or any(pseudo in css for pseudo in _PLAYWRIGHT_PSEUDOS):
+        return None
+    return css
+
+class SnapshotStore:
+    """Stores page DOM snapshots on disk, keyed by URL"""
+    
+    def __init__(self, snapshot_dir: str = Config.SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+    
+    def path_for(self, url: str) -> str:
+        """Snapshot file path for a URL"""
+        return os.path.join(self.snapshot_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".html")
+    
+    def load(self, url: str) -> Optional[str]:
+        """Load a stored snapshot, or None if the page was never captured"""
+        try:
+            with open(self.path_for(url), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def save(self, url: str, html: str) -> str:
+        """Store a snapshot and return its path"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self.path_for(url)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+        return path
+    
+    async def capture(self, url: str, run_guard: Optional[Callable[[], AsyncContextManager]] = None) -> Optional[str]:
+        """Load the page once in a browser and store its rendered DOM, inside run_guard if given"""
+        if run_guard:
+            async with run_guard():
+                return await self._capture(url)
+        return await self._capture(url)
+    
+    async def _capture(self, url: str) -> Optional[str]:
+        driver = BrowserDriver()
+        try:
+            if not await driver.start():
+                return None
+            if not await driver.navigate_to(url):
+                return None
+            html = await driver.get_content()
+            if html is None:
+                return None
+            await asyncio.to_thread(self.save, url, html)
+            logger.info(f"Captured DOM snapshot of {url}")
+            return html
+        finally:
+            await driver.close()
+    
+    async def get_or_capture(self, url: str, refresh: bool = False, run_guard: Optional[Callable[[], AsyncContextManager]] = None) -> Optional[str]:
+        """Get the stored snapshot, capturing it first if missing or refresh is requested"""
+        if not refresh:
+            html = await asyncio.to_thread(self.load, url)
+            if html is not None:
+                return html
+        return await self.capture(url, run_guard)
+
+class DryRunValidator:
+    """Checks plan steps against one parsed snapshot; reuse it to validate many plans"""
+    
+    def __init__(self, html: str):
+        self.tree = LexborHTMLParser(html)
+    
+    def validate(self, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Report which steps would fail against the snapshot"""
+        reports = []
+        page_changed = False
+        
+        for i, step in enumerate(steps):
+            report = self._check_step(step)
+            report["step"] = i
+            # After a click or goto the page may have changed, so a missing element is not conclusive
+            if page_changed and report["status"] == "fail" and report.get("reason") == "No element matches selector":
+                report["status"] = "unverified"
+                report["reason"] = "Element not in snapshot; it may appear after an earlier click or goto"
+            if step.get("action") in ("click", "goto"):
+                page_changed = True
+            reports.append(report)
+        
+        failed_steps = [report["step"] for report in reports if report["status"] == "fail"]
+        return {
+            "success": not failed_steps,
+            "failed_steps": failed_steps,
+            "steps": reports
+        }
+    
+    def _check_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        """Check a single step"""
+        action = step.get("action")
+        selector = step.get("selector")
+        report = {"action": action, "selector": selector}
+        
+        if action == "paginate":
+            # Only the first page is in the snapshot, so check the sub-steps against it
+            nested = self.validate(step.get("steps") or [])
+            status = "fail" if nested["failed_steps"] or not step.get("steps") else "ok"
+            report = {**report, "status": status, "steps": nested["steps"]}
+            if not step.get("steps"):
+                report["reason"] = "Paginate requires steps"
+            return report
+        if action not in KNOWN_ACTIONS:
+            return {**report, "status": "fail", "reason": f"Unknown action: {action}"}
+        if action == "screenshot":
+            return {**report, "status": "ok"}
+        if action == "goto":
+            # Navigates away from the snapshot, so there is no selector to check
+            if not step.get("url"):
+                return {**report, "status": "fail", "reason": "Missing url"}
+            return {**report, "status": "ok"}
+        if not selector:
+            return {**report, "status": "fail", "reason": "Missing selector"}
+        
+        css = to_css(selector)
+        if css is None:
+            return {**report, "status": "unverified", "reason": "Playwright-specific selector cannot be checked offline"}
+        
+        try:
+            matches = self.tree.css(css)
+        except Exception:
+            return {**report, "status": "fail", "reason": "Invalid CSS selector"}
+        
+        report["matches"] = len(matches)
+        if not matches:
+            return {**report, "status": "fail", "reason": "No element matches selector"}
+        
+        if action == "type":
+            element = matches[0]
+            if element.tag not in EDITABLE_TAGS and "contenteditable" not in element.attributes:
+                return {**report, "status": "fail", "reason": f"First match is a <{element.tag}>, not an editable element"}
+        
+        return {**report, "status": "ok"}
+
+async def dry_run(
+    url: str,
+    plans: List[List[Dict[str, Any]]],
+    refresh: bool = False,
+    store: Optional[SnapshotStore] = None,
+    run_guard: Optional[Callable[[], AsyncContextManager]] = None
+) -> Dict[str, Any]:
+    """Validate one or more plans against the stored snapshot of a page; run_guard is entered only if a browser is needed"""
+    store = store or SnapshotStore()
+    html = await store.get_or_capture(url, refresh, run_guard)
+    if html is None:
+        return {"success": False, "error": f"Cannot capture snapshot of {url}"}
+    
+    validator = DryRunValidator(html)
+    return {
+        "success": True,
+        "reports": [validator.validate(steps) for steps in plans]
+    }
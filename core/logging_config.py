@@ -0,0 +1,103 @@
+"""Queue-backed JSON logging with task/step context and sampling of success-path logs"""
+import contextvars
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+from config import Config
+
+task_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_id", default=None)
+step_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("step_id", default=None)
+
+# Pass as extra= on success-path logs in hot paths; they are kept at LOG_SUCCESS_SAMPLE_RATE
+SAMPLED = {"sampled": True}
+
+_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the current task and step ids (runs in the logging coroutine's context)"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.task_id = task_id_var.get()
+        record.step_id = step_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records marked as sampled; warnings and errors always pass"""
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, "task_id", None):
+            entry["task_id"] = record.task_id
+        if getattr(record, "step_id", None):
+            entry["step_id"] = record.step_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class _ContextFormatter(logging.Formatter):
+    """Plain-text format that shows the task and step ids when set"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        ids = "/".join(value for value in (getattr(record, "task_id", None), getattr(record, "step_id", None)) if value)
+        record.context = f" [{ids}]" if ids else ""
+        return super().format(record)
+
+def setup_logging(
+    level: str = Config.LOG_LEVEL,
+    log_format: str = Config.LOG_FORMAT,
+    sample_rate: float = Config.LOG_SUCCESS_SAMPLE_RATE,
+    stream: Optional[TextIO] = None
+):
+    """Route root logging through a queue so handlers write on a background thread"""
+    global _handler, _listener
+    stop_logging()
+    
+    output = logging.StreamHandler(stream or sys.stderr)
+    if log_format == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(_ContextFormatter("%(asctime)s - %(name)s - %(levelname)s%(context)s - %(message)s"))
+    
+    log_queue = queue.SimpleQueue()
+    _handler = QueueHandler(log_queue)
+    # Filters run on the emitting side, where the task context is visible and dropped records cost least
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(SamplingFilter(sample_rate))
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(_handler)
+
+def stop_logging():
+    """Flush queued records and detach the queue handler"""
+    global _handler, _listener
+    if _handler:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener:
+        _listener.stop()
+        _listener = None
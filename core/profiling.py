@@ -0,0 +1,70 @@
+"""On-demand profiling of single task runs, written as flamegraph-ready artifacts"""
+import asyncio
+import cProfile
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, Awaitable, Optional
+from config import Config
+from core.tracing import prune_artifacts
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIXES = (".speedscope.json", ".prof")
+
+# cProfile hooks the whole thread, so only one fallback session can run at a time
+_cprofile_active = False
+
+def _write_text(path: str, content: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+async def profile_run(label: str, run: Awaitable[Dict[str, Any]], profile_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Await a task run under a profiler and add the artifact path to its result"""
+    global _cprofile_active
+    
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+    
+    profile_dir = profile_dir or Config.PROFILE_DIR
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{label}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    
+    if Profiler:
+        # Async-aware sampling that follows this run across awaits; open the output at https://www.speedscope.app
+        from pyinstrument.renderers import SpeedscopeRenderer
+        
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            result = await run
+        finally:
+            profiler.stop()
+        path = os.path.join(profile_dir, name + ".speedscope.json")
+        await asyncio.to_thread(lambda: _write_text(path, profiler.output(SpeedscopeRenderer())))
+    else:
+        # Deterministic fallback (view with snakeviz or flameprof); it is not async-aware, so it also
+        # records other coroutines running meanwhile and writes .prof instead of a speedscope flamegraph
+        logger.warning("pyinstrument is not installed, profiling with cProfile; the profile includes other concurrent requests")
+        if _cprofile_active:
+            logger.warning("Another run is already being profiled with cProfile, running without profiling")
+            return await run
+        
+        profile = cProfile.Profile()
+        _cprofile_active = True
+        profile.enable()
+        try:
+            result = await run
+        finally:
+            profile.disable()
+            _cprofile_active = False
+        path = os.path.join(profile_dir, name + ".prof")
+        await asyncio.to_thread(profile.dump_stats, path)
+    
+    await asyncio.to_thread(prune_artifacts, profile_dir, Config.PROFILE_MAX_ARTIFACTS, PROFILE_SUFFIXES)
+    logger.info(f"Profile written to {path}")
+    result["profile"] = path
+    return result
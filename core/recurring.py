@@ -0,0 +1,281 @@
+"""Recurring task scheduler that emits only what changed in extracted text between runs"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Any, List, Optional, Set, Union
+from config import Config
+from core.task_executor import TaskExecutor
+
+logger = logging.getLogger(__name__)
+
+# Field ranges of a five-field cron expression: minute hour day-of-month month day-of-week (0 and 7 are Sunday)
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    """Values matched by one cron field (*, lists, ranges and /steps)"""
+    values = set()
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(value) for value in spec.split("-", 1))
+        else:
+            start = end = int(spec)
+            if step:
+                end = high
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range: {part}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+class CronSchedule:
+    """Five-field cron expression evaluated in local time"""
+    
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        # Cron numbers Sunday as 0 or 7, Python as 6
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+    
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        weekday_match = moment.weekday() in self.weekdays
+        # As in cron, restricting both fields matches either one
+        if not self.any_day and not self.any_weekday:
+            return day_match or weekday_match
+        return day_match and weekday_match
+    
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+def extract_values(results: Dict[str, Any], prefix: str = "") -> Dict[str, str]:
+    """Extracted texts of a task's step results keyed by step (and page for paginate steps)"""
+    values = {}
+    for key, result in (results or {}).items():
+        if not result.get("success"):
+            continue
+        if result.get("text") is not None:
+            values[prefix + key] = result["text"]
+        for page in result.get("page_results") or []:
+            values.update(extract_values(page.get("results"), f"{prefix}{key}.page_{page.get('page')}."))
+    return values
+
+def diff_values(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, Any]:
+    """Added, changed and removed extracted values; empty when nothing changed"""
+    diff = {}
+    added = {key: value for key, value in new.items() if key not in old}
+    changed = {key: {"old": old[key], "new": value} for key, value in new.items() if key in old and old[key] != value}
+    removed = sorted(key for key in old if key not in new)
+    if added:
+        diff["added"] = added
+    if changed:
+        diff["changed"] = changed
+    if removed:
+        diff["removed"] = removed
+    return diff
+
+class RecurringJob:
+    """A task run on a cron or interval schedule"""
+    
+    def __init__(self, name: str, task_config: Dict[str, Any], cron: Optional[str] = None, interval: Optional[float] = None, jitter: float = 0.0):
+        if (cron is None) == (interval is None):
+            raise ValueError("A recurring job needs exactly one of cron or interval")
+        self.name = name
+        self.task_config = task_config
+        self.cron = CronSchedule(cron) if cron else None
+        self.interval = interval
+        self.jitter = jitter
+        self.running: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.changes = 0
+        self.failures = 0
+        self.overlaps = 0
+        self.last_run: Optional[float] = None
+    
+    def next_delay(self) -> float:
+        """Seconds until the next run, including a random jitter"""
+        if self.cron:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            delay = self.interval
+        return delay + random.uniform(0, self.jitter)
+
+def load_job_specs(path: str) -> List[Dict[str, Any]]:
+    """Read a JSON list of jobs: name, task, cron or interval, and optional jitter"""
+    with open(path, encoding="utf-8") as f:
+        specs = json.load(f)
+    if not isinstance(specs, list):
+        raise ValueError(f"Recurring job file must hold a JSON list: {path}")
+    return specs
+
+DiffCallback = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+class RecurringScheduler:
+    """Runs jobs on their schedules, skipping a run while the previous one is still going"""
+    
+    def __init__(
+        self,
+        on_change: Optional[DiffCallback] = None,
+        state_path: Optional[str] = Config.RECURRING_STATE_PATH,
+        executor_factory: Callable[[], Any] = TaskExecutor,
+        run_guard: Optional[Callable[[], AsyncContextManager]] = None
+    ):
+        self.on_change = on_change
+        self.state_path = state_path
+        self.executor_factory = executor_factory
+        self.run_guard = run_guard  # Entered around each run, e.g. to hold an admission slot
+        self.jobs: Dict[str, RecurringJob] = {}
+        self.last_values: Dict[str, Dict[str, str]] = self._load()
+        self._timers: Dict[str, asyncio.Task] = {}
+    
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        """Load the last extracted values saved by earlier runs"""
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Failed to load recurring task state: {e}")
+            return {}
+    
+    def _save(self, last_values: Dict[str, Dict[str, str]]):
+        """Persist the last extracted values of every job"""
+        if not self.state_path:
+            return
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(last_values, f, ensure_ascii=False)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"Failed to save recurring task state: {e}")
+    
+    def add(self, name: str, task_config: Dict[str, Any], cron: Optional[str] = None, interval: Optional[float] = None, jitter: float = 0.0) -> RecurringJob:
+        """Register a job; it starts with start() or immediately if the scheduler is running"""
+        job = RecurringJob(name, task_config, cron, interval, jitter)
+        self.jobs[name] = job
+        if self._timers:
+            self._start_timer(job)
+        return job
+    
+    def add_jobs(self, specs: List[Dict[str, Any]]):
+        """Register jobs described as in load_job_specs"""
+        for spec in specs:
+            self.add(spec["name"], spec["task"], spec.get("cron"), spec.get("interval"), spec.get("jitter", 0.0))
+    
+    def start(self):
+        """Start the timers of all jobs on the running event loop"""
+        for job in self.jobs.values():
+            if job.name not in self._timers:
+                self._start_timer(job)
+    
+    def _start_timer(self, job: RecurringJob):
+        self._timers[job.name] = asyncio.create_task(self._timer(job))
+    
+    async def _timer(self, job: RecurringJob):
+        """Fire a job on schedule; a run never overlaps the previous run of the same job"""
+        while True:
+            await asyncio.sleep(job.next_delay())
+            if job.running and not job.running.done():
+                job.overlaps += 1
+                logger.warning("Skipping run of %s, previous run still in progress", job.name)
+                continue
+            job.running = asyncio.create_task(self.run_job(job.name))
+    
+    async def run_job(self, name: str) -> Optional[Dict[str, Any]]:
+        """Run a job once and emit its change event; returns the event, or None when nothing changed"""
+        job = self.jobs[name]
+        job.runs += 1
+        job.last_run = time.time()
+        try:
+            if self.run_guard:
+                async with self.run_guard():
+                    result = await self.executor_factory().execute_task(job.task_config)
+            else:
+                result = await self.executor_factory().execute_task(job.task_config)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        if not result.get("success"):
+            job.failures += 1
+            event = {"job": name, "success": False, "error": result.get("error"), "diff": {}}
+        else:
+            values = extract_values(result.get("results"))
+            diff = diff_values(self.last_values.get(name, {}), values)
+            if not diff:
+                return None
+            job.changes += 1
+            self.last_values[name] = values
+            # Saved from a snapshot so other jobs can update their values meanwhile
+            await asyncio.to_thread(self._save, dict(self.last_values))
+            event = {"job": name, "success": True, "diff": diff}
+        
+        event["run_at"] = job.last_run
+        await self._emit(event)
+        return event
+    
+    async def _emit(self, event: Dict[str, Any]):
+        if not self.on_change:
+            return
+        try:
+            outcome = self.on_change(event)
+            if inspect.isawaitable(outcome):
+                await outcome
+        except Exception as e:
+            logger.error(f"Change callback failed for {event['job']}: {e}")
+    
+    async def close(self):
+        """Stop the timers and wait for runs in progress"""
+        timers = list(self._timers.values())
+        self._timers.clear()
+        for timer in timers:
+            timer.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+        running = [job.running for job in self.jobs.values() if job.running and not job.running.done()]
+        await asyncio.gather(*running, return_exceptions=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Runs, changes, failures and skipped overlapping runs per job"""
+        return {
+            name: {
+                "schedule": job.cron.expression if job.cron else f"every {job.interval}s",
+                "running": bool(job.running and not job.running.done()),
+                "runs": job.runs,
+                "changes": job.changes,
+                "failures": job.failures,
+                "overlaps": job.overlaps,
+                "last_run": job.last_run
+            }
+            for name, job in self.jobs.items()
+        }
@@ -0,0 +1,126 @@
+"""In-flight coalescing and a short-TTL result cache for identical read-only tasks"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Actions that change page or server state; tasks using them are only shared when explicitly allowed
+MUTATING_ACTIONS = {"click", "type"}
+
+# Step fields that do not affect what a task returns
+_IGNORED_STEP_FIELDS = {"description"}
+
+def is_read_only(steps: List[Dict[str, Any]]) -> bool:
+    """Whether no step (including paginate sub-steps) clicks or types"""
+    for step in steps:
+        if step.get("action") in MUTATING_ACTIONS:
+            return False
+        if step.get("steps") and not is_read_only(step["steps"]):
+            return False
+    return True
+
+def _canonical_step(step: Dict[str, Any]) -> Dict[str, Any]:
+    canonical = {key: value for key, value in step.items() if value is not None and key not in _IGNORED_STEP_FIELDS}
+    if step.get("steps"):
+        canonical["steps"] = [_canonical_step(sub_step) for sub_step in step["steps"]]
+    return canonical
+
+def task_key(task_config: Dict[str, Any]) -> str:
+    """Canonical hash of the parts of a task that determine its result"""
+    canonical = {
+        "url": task_config.get("url"),
+        "steps": [_canonical_step(step) for step in task_config.get("steps", [])],
+        # Server HTML (static mode) and the rendered DOM can yield different text, and cached assets may be stale
+        "mode": task_config.get("mode") or Config.TASK_MODE,
+        "asset_cache": bool(task_config.get("asset_cache", Config.ASSET_CACHE_ENABLED))
+    }
+    # Profiles can change what a page renders (e.g. with JavaScript off)
+    if task_config.get("browser_profile"):
+        canonical["browser_profile"] = task_config["browser_profile"]
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class TaskResultCache:
+    """Shares one execution among concurrent duplicates and serves recent successful results"""
+    
+    def __init__(self, ttl: float = Config.RESULT_CACHE_TTL, max_entries: int = Config.RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.counts = {"miss": 0, "hit": 0, "coalesced": 0, "bypass": 0}
+    
+    def cacheable(self, task_config: Dict[str, Any]) -> bool:
+        """Read-only tasks are shared unless the task opts out; others only when it opts in"""
+        # Traced and profiled runs exist to observe a fresh execution
+        if task_config.get("trace") or task_config.get("profile"):
+            return False
+        allowed = task_config.get("cache")
+        if allowed is not None:
+            return allowed
+        return is_read_only(task_config.get("steps", []))
+    
+    async def run(self, task_config: Dict[str, Any], execute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+        """Run a task through the cache, returning its result and cache status (miss, hit, coalesced or bypass)"""
+        if not self.cacheable(task_config):
+            self.counts["bypass"] += 1
+            return await execute(), "bypass"
+        
+        key = task_key(task_config)
+        cached = self._get(key)
+        if cached is not None:
+            self.counts["hit"] += 1
+            return cached, "hit"
+        
+        running = self.inflight.get(key)
+        if running is not None:
+            self.counts["coalesced"] += 1
+            # Shielded so one waiter going away does not cancel the shared run
+            return copy.deepcopy(await asyncio.shield(running)), "coalesced"
+        
+        self.counts["miss"] += 1
+        running = asyncio.ensure_future(execute())
+        self.inflight[key] = running
+        running.add_done_callback(lambda done: self._finish(key, done))
+        return copy.deepcopy(await asyncio.shield(running)), "miss"
+    
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Copy of a fresh cached result, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return copy.deepcopy(result)
+    
+    def _finish(self, key: str, done: asyncio.Future):
+        """Store a successful shared run and stop coalescing onto it"""
+        self.inflight.pop(key, None)
+        if done.cancelled() or done.exception() is not None or self.ttl <= 0:
+            return
+        result = done.result()
+        if not result.get("success"):
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache status counts and sizes"""
+        return {
+            **self.counts,
+            "entries": len(self.entries),
+            "inflight": len(self.inflight)
+        }
+
+result_cache = TaskResultCache()
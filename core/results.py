@@ -0,0 +1,169 @@
+"""Per-run task results and streaming result sinks"""
+import json
+import logging
+import sqlite3
+import uuid
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class StepResult:
+    """Compact record of a single step's outcome"""
+    
+    __slots__ = ("index", "success", "action", "selector", "text", "path", "error", "extra")
+    
+    # Keys stored in dedicated slots; anything else goes into extra
+    FIELDS = ("success", "action", "selector", "text", "path", "error")
+    
+    def __init__(
+        self,
+        index: int,
+        success: bool,
+        action: Optional[str] = None,
+        selector: Optional[str] = None,
+        text: Optional[str] = None,
+        path: Optional[str] = None,
+        error: Optional[str] = None,
+        extra: Optional[Dict[str, Any]] = None
+    ):
+        self.index = index
+        self.success = success
+        self.action = action
+        self.selector = selector
+        self.text = text
+        self.path = path
+        self.error = error
+        self.extra = extra
+    
+    @classmethod
+    def from_dict(cls, index: int, data: Dict[str, Any]) -> "StepResult":
+        """Build a record from a step result dict"""
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        return cls(
+            index,
+            bool(data.get("success", False)),
+            action=data.get("action"),
+            selector=data.get("selector"),
+            text=data.get("text"),
+            path=data.get("path"),
+            error=data.get("error"),
+            extra=extra or None
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the step result dict format returned by TaskExecutor"""
+        data = {"success": self.success}
+        for field in self.FIELDS[1:]:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def summary(self) -> "StepResult":
+        """Copy without the extracted payload, for runs that only stream results"""
+        return StepResult(self.index, self.success, self.action, self.selector, path=self.path, error=self.error)
+
+class ResultSink:
+    """Receives step results as they are produced"""
+    
+    def write(self, task_id: str, step_result: StepResult):
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+class MemorySink(ResultSink):
+    """Keeps step results in memory, optionally only the most recent max_items"""
+    
+    def __init__(self, max_items: Optional[int] = None):
+        self.items = deque(maxlen=max_items)
+    
+    def write(self, task_id: str, step_result: StepResult):
+        self.items.append((task_id, step_result))
+
+class JSONLSink(ResultSink):
+    """Appends step results to a JSON Lines file"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+    
+    def write(self, task_id: str, step_result: StepResult):
+        record = {"task_id": task_id, "step": step_result.index, **step_result.to_dict()}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    def close(self):
+        self.file.close()
+
+class SQLiteSink(ResultSink):
+    """Stores step results in a SQLite table, committing in batches"""
+    
+    def __init__(self, path: str, commit_every: int = 100):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS step_results ("
+            "task_id TEXT, step INTEGER, success INTEGER, action TEXT, "
+            "selector TEXT, text TEXT, path TEXT, error TEXT, extra TEXT)"
+        )
+        self.commit_every = commit_every
+        self.pending = 0
+    
+    def write(self, task_id: str, step_result: StepResult):
+        self.connection.execute(
+            "INSERT INTO step_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                task_id,
+                step_result.index,
+                int(step_result.success),
+                step_result.action,
+                step_result.selector,
+                step_result.text,
+                step_result.path,
+                step_result.error,
+                json.dumps(step_result.extra, ensure_ascii=False) if step_result.extra else None
+            )
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.connection.commit()
+            self.pending = 0
+    
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+class TaskRun:
+    """Results of a single task execution"""
+    
+    def __init__(
+        self,
+        task_id: Optional[str] = None,
+        sinks: Optional[List[ResultSink]] = None,
+        retain: bool = True
+    ):
+        self.task_id = task_id or uuid.uuid4().hex[:12]
+        self.sinks = sinks or []
+        self.retain = retain
+        self.steps: List[StepResult] = []
+        # Per-run counters reported alongside the results (e.g. asset cache hits)
+        self.stats: Dict[str, Any] = {}
+    
+    def add(self, step_result: StepResult):
+        """Record a step result and stream it to every sink"""
+        self.emit(step_result)
+        self.steps.append(step_result if self.retain else step_result.summary())
+    
+    def emit(self, step_result: StepResult):
+        """Stream a partial result (e.g. one page of a paginate step) without recording it"""
+        for sink in self.sinks:
+            try:
+                sink.write(self.task_id, step_result)
+            except Exception as e:
+                logger.error(f"Result sink {type(sink).__name__} failed: {e}")
+    
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Step results keyed as step_0, step_1, ..."""
+        return {f"step_{step.index}": step.to_dict() for step in sorted(self.steps, key=lambda step: step.index)}
@@ -0,0 +1,239 @@
+"""Per-domain politeness scheduler for running many tasks concurrently"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, AsyncContextManager
+from urllib.parse import urlparse
+from config import Config
+from core.task_executor import TaskExecutor
+
+logger = logging.getLogger(__name__)
+
+# Navigation responses that mean the host wants us to slow down
+BACKOFF_STATUSES = {429, 503}
+
+class TokenBucket:
+    """Token bucket limiting the request rate to a domain"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        """Add tokens for the time elapsed since the last refill"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def time_until_available(self) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        if self.rate <= 0:
+            return 0.0  # Rate limiting disabled
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def consume(self) -> bool:
+        """Take one token if available"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class _DomainState:
+    """Queue and limits for a single domain"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.queue = deque()
+        self.active = 0
+        self.bucket = TokenBucket(rate, burst)
+        self.backoff_until = 0.0
+        self.backoff_failures = 0
+        self.completed = 0
+        self.throttled = 0
+
+class DomainScheduler:
+    """Runs tasks through TaskExecutor with per-domain concurrency caps, rate limits and backoff"""
+    
+    def __init__(
+        self,
+        max_concurrency: int = Config.SCHEDULER_MAX_CONCURRENCY,
+        domain_concurrency: int = Config.SCHEDULER_DOMAIN_CONCURRENCY,
+        domain_rate: float = Config.SCHEDULER_DOMAIN_RATE,
+        domain_burst: int = Config.SCHEDULER_DOMAIN_BURST,
+        backoff_base: float = Config.SCHEDULER_BACKOFF_BASE,
+        backoff_max: float = Config.SCHEDULER_BACKOFF_MAX,
+        max_retries: int = Config.SCHEDULER_MAX_RETRIES,
+        executor_factory: Callable[[], Any] = TaskExecutor,
+        run_guard: Optional[Callable[[], AsyncContextManager]] = None
+    ):
+        self.max_concurrency = max_concurrency
+        self.domain_concurrency = domain_concurrency
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self.executor_factory = executor_factory
+        self.run_guard = run_guard  # Entered around each execution, e.g. to hold an admission slot
+        
+        self._domains: Dict[str, _DomainState] = {}
+        self._rotation = deque()  # Domains with queued tasks, in round-robin order
+        self._active = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._workers = set()
+    
+    async def submit(self, task_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a task and wait for its result"""
+        self._ensure_dispatcher()
+        domain = urlparse(task_config.get("url") or "").hostname or ""
+        
+        state = self._domains.get(domain)
+        if state is None:
+            state = _DomainState(self.domain_rate, self.domain_burst)
+            self._domains[domain] = state
+        
+        future = asyncio.get_running_loop().create_future()
+        state.queue.append((task_config, future, 0))
+        if domain not in self._rotation:
+            self._rotation.append(domain)
+        self._wakeup.set()
+        
+        return await future
+    
+    async def run_all(self, task_configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run a batch of tasks, returning results in submission order"""
+        return await asyncio.gather(*(self.submit(task_config) for task_config in task_configs))
+    
+    async def close(self):
+        """Stop dispatching and fail queued tasks; tasks already running are left to finish"""
+        for state in self._domains.values():
+            while state.queue:
+                _, future, _ = state.queue.popleft()
+                if not future.done():
+                    future.set_result({"success": False, "error": "Scheduler closed"})
+        self._rotation.clear()
+        
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, active tasks and throttling counts per domain"""
+        now = time.monotonic()
+        return {
+            "active": self._active,
+            "domains": {
+                domain: {
+                    "queued": len(state.queue),
+                    "active": state.active,
+                    "completed": state.completed,
+                    "throttled": state.throttled,
+                    "backoff_remaining": max(0.0, state.backoff_until - now)
+                }
+                for domain, state in self._domains.items()
+            }
+        }
+    
+    def _ensure_dispatcher(self):
+        """Start the dispatch loop on the running event loop"""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+    
+    async def _dispatch_loop(self):
+        """Start tasks whenever a slot, token and domain become available"""
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _dispatch_ready(self) -> Optional[float]:
+        """Start as many tasks as limits allow; returns seconds until the next retry (None to wait for an event)"""
+        next_delay = None
+        progressed = True
+        
+        while progressed and self._active < self.max_concurrency:
+            progressed = False
+            for _ in range(len(self._rotation)):
+                domain = self._rotation[0]
+                self._rotation.rotate(-1)
+                state = self._domains[domain]
+                
+                if state.active >= self.domain_concurrency:
+                    continue  # Woken again when one of its tasks finishes
+                
+                wait = max(state.backoff_until - time.monotonic(), state.bucket.time_until_available())
+                if wait > 0:
+                    next_delay = wait if next_delay is None else min(next_delay, wait)
+                    continue
+                
+                state.bucket.consume()
+                task_config, future, attempt = state.queue.popleft()
+                if not state.queue:
+                    self._rotation.remove(domain)
+                
+                state.active += 1
+                self._active += 1
+                worker = asyncio.create_task(self._run(domain, state, task_config, future, attempt))
+                self._workers.add(worker)
+                worker.add_done_callback(self._workers.discard)
+                
+                # Restart the pass so the next domain in rotation goes first
+                progressed = True
+                break
+        
+        return next_delay
+    
+    async def _run(self, domain: str, state: _DomainState, task_config: Dict[str, Any], future: asyncio.Future, attempt: int):
+        """Execute one task and apply backoff based on the navigation status"""
+        try:
+            executor = self.executor_factory()
+            if self.run_guard:
+                async with self.run_guard():
+                    result = await executor.execute_task(task_config)
+            else:
+                result = await executor.execute_task(task_config)
+            status = getattr(executor.driver, "last_status", None)
+            
+            if status in BACKOFF_STATUSES:
+                state.throttled += 1
+                state.backoff_failures += 1
+                delay = min(self.backoff_base * 2 ** (state.backoff_failures - 1), self.backoff_max)
+                state.backoff_until = max(state.backoff_until, time.monotonic() + delay)
+                logger.warning(f"{domain} returned {status}, backing off for {delay:.1f}s")
+                
+                if attempt < self.max_retries:
+                    state.queue.appendleft((task_config, future, attempt + 1))
+                    if domain not in self._rotation:
+                        self._rotation.append(domain)
+                    return
+            else:
+                state.backoff_failures = 0
+            
+            state.completed += 1
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"Scheduled task failed: {e}")
+            if not future.done():
+                future.set_result({"success": False, "error": str(e)})
+        finally:
+            state.active -= 1
+            self._active -= 1
+            self._wakeup.set()
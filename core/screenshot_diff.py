@@ -0,0 +1,132 @@
+"""Perceptual-hash change detection so repeated screenshots are only stored when the page looks different"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 64-bit dHash
+
+_warned_no_pillow = False
+
+def dhash(data: bytes, size: int = HASH_SIZE) -> Optional[int]:
+    """Difference hash of an image, or None if Pillow is missing or the image cannot be decoded"""
+    global _warned_no_pillow
+    try:
+        from PIL import Image
+    except ImportError:
+        if not _warned_no_pillow:
+            _warned_no_pillow = True
+            logger.warning("Pillow is not installed; screenshots are compared by exact digest, so any pixel change counts as changed")
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = image.convert("L").resize((size + 1, size), Image.LANCZOS).tobytes()
+    except Exception as e:
+        logger.warning("Cannot hash screenshot: %s", e)
+        return None
+    
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            offset = row * (size + 1) + col
+            value = value << 1 | (pixels[offset] > pixels[offset + 1])
+    return value
+
+def fingerprint(data: bytes) -> Tuple[str, str]:
+    """Perceptual hash of a screenshot, falling back to an exact digest without Pillow"""
+    value = dhash(data)
+    if value is None:
+        return "sha256", hashlib.sha256(data).hexdigest()
+    return "dhash", f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+def distance(kind: str, first: str, second: str) -> Optional[int]:
+    """Differing bits between two dHashes; None for exact digests, which can only match or not"""
+    if kind != "dhash":
+        return None
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+class ScreenshotChangeDetector:
+    """Last stored screenshot fingerprint per change key, persisted as JSON"""
+    
+    def __init__(self, path: Optional[str] = Config.SCREENSHOT_HASH_PATH):
+        self.path = path
+        self.fingerprints: Dict[str, Dict[str, Any]] = {}
+        self.counts = {"changed": 0, "unchanged": 0}
+        self._lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        """Load fingerprints stored by earlier runs"""
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.fingerprints = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Failed to load screenshot fingerprints: {e}")
+    
+    def _save(self):
+        """Persist fingerprints (caller holds the lock)"""
+        if not self.path:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.fingerprints, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save screenshot fingerprints: {e}")
+    
+    def _compare_and_store(self, change_key: str, data: bytes, path: str, threshold: int) -> Dict[str, Any]:
+        """Write the screenshot only if it differs from the last stored one by more than threshold bits"""
+        kind, value = fingerprint(data)
+        with self._lock:
+            last = self.fingerprints.get(change_key)
+            if last is None or last["kind"] != kind:
+                changed, bits = True, None
+            else:
+                bits = distance(kind, last["hash"], value)
+                changed = last["hash"] != value if bits is None else bits > threshold
+            
+            if not changed:
+                self.counts["unchanged"] += 1
+                return {"changed": False, "distance": bits, "path": last["path"]}
+            
+            with open(path, "wb") as f:
+                f.write(data)
+            # Compared against the last stored image, so slow drift is still caught once it adds up
+            self.fingerprints[change_key] = {"kind": kind, "hash": value, "path": path}
+            self._save()
+            self.counts["changed"] += 1
+            return {"changed": True, "distance": bits, "path": path}
+    
+    async def check(self, change_key: str, data: bytes, path: str, threshold: int = Config.SCREENSHOT_CHANGE_THRESHOLD) -> Dict[str, Any]:
+        """Hash and compare off the event loop; returns changed, distance and the stored screenshot path"""
+        return await asyncio.to_thread(self._compare_and_store, change_key, data, path, threshold)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Keys tracked and how many screenshots were stored or skipped"""
+        with self._lock:
+            return {"keys": len(self.fingerprints), **self.counts}
+
+_change_detector: Optional[ScreenshotChangeDetector] = None
+
+def get_change_detector() -> ScreenshotChangeDetector:
+    """Get the process-wide screenshot change detector"""
+    global _change_detector
+    if _change_detector is None:
+        _change_detector = ScreenshotChangeDetector()
+    return _change_detector
+
+def get_change_detector_stats() -> Optional[Dict[str, Any]]:
+    """Get stats of the change detector, or None if no screenshot has used it"""
+    return _change_detector.get_stats() if _change_detector else None
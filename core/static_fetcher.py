@@ -0,0 +1,103 @@
+"""HTTP-only execution of tasks that just wait for and read elements on server-rendered pages"""
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from selectolax.lexbor import LexborHTMLParser
+from config import Config
+from core.dry_run import to_css
+
+logger = logging.getLogger(__name__)
+
+STATIC_ACTIONS = {"wait", "get_text"}
+
+def static_ineligibility(steps: List[Dict[str, Any]]) -> Optional[str]:
+    """Why a task needs a browser, or None if every step can run on fetched HTML"""
+    for i, step in enumerate(steps):
+        if step.get("action") not in STATIC_ACTIONS:
+            return f"step {i} action {step.get('action')} needs a browser"
+        if step.get("depends_on") or step.get("page"):
+            return f"step {i} uses tabs"
+        if not step.get("selector") or to_css(step["selector"]) is None:
+            return f"step {i} selector is not plain CSS"
+    return None
+
+class StaticFetcher:
+    """Pooled HTTP client that runs static steps against the server-rendered HTML"""
+    
+    def __init__(self):
+        self.client = None
+        self._loop = None
+        self.fetches = 0
+        self.fallbacks = 0
+    
+    def _get_client(self):
+        """Keep-alive client for the running event loop"""
+        import httpx
+        
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._loop is not loop:
+            # Connections belong to the loop that opened them
+            self.client = httpx.AsyncClient(
+                follow_redirects=True,
+                headers={"User-Agent": Config.STATIC_USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=Config.STATIC_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.STATIC_MAX_CONNECTIONS
+                )
+            )
+            self._loop = loop
+        return self.client
+    
+    async def fetch(self, url: str, timeout_ms: int) -> Optional[Tuple[int, str]]:
+        """Fetch a page, returning its status and HTML, or None if it is not a successful HTML response"""
+        try:
+            response = await self._get_client().get(url, timeout=timeout_ms / 1000)
+        except Exception as e:
+            logger.warning("Static fetch of %s failed: %s", url, e)
+            return None
+        if response.status_code >= 400 or "html" not in response.headers.get("content-type", "html"):
+            return None
+        return response.status_code, response.text
+    
+    async def run_steps(self, url: str, steps: List[Dict[str, Any]], timeout_ms: int) -> Optional[List[Dict[str, Any]]]:
+        """Step results in TaskExecutor's format, or None when the browser is needed instead"""
+        self.fetches += 1
+        page = await self.fetch(url, timeout_ms)
+        if page is None:
+            self.fallbacks += 1
+            return None
+        
+        tree = LexborHTMLParser(page[1])
+        results = []
+        for step in steps:
+            selector = step["selector"]
+            try:
+                node = tree.css_first(to_css(selector))
+            except Exception:
+                node = None
+            if node is None:
+                # Content may be rendered by JavaScript, so let the browser try
+                logger.info("Selector %s not in static HTML, falling back to browser", selector)
+                self.fallbacks += 1
+                return None
+            if step["action"] == "wait":
+                results.append({"success": True, "action": "wait", "selector": selector})
+            else:
+                results.append({"success": True, "action": "get_text", "selector": selector, "text": node.text(deep=True)})
+        return results
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Static attempts and how many fell back to the browser"""
+        return {
+            "fetches": self.fetches,
+            "fallbacks": self.fallbacks,
+            "served": self.fetches - self.fallbacks
+        }
+    
+    async def close(self):
+        """Close pooled connections"""
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+static_fetcher = StaticFetcher()
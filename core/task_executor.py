@@ -1,62 +1,283 @@
 import asyncio
+import hashlib
+import json
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Callable, Dict, Any, List, Optional
+from config import Config
 from core.browser_driver import BrowserDriver
+from core.deadline import Deadline
+from core.logging_config import task_id_var, step_id_var
+from core.asset_cache import get_asset_cache
+from core.tracing import TraceCapture
+from core.results import ResultSink, StepResult, TaskRun
 
 logger = logging.getLogger(__name__)
 
 class TaskExecutor:
     """Task executor responsible for executing automation tasks"""
     
-    def __init__(self):
+    def __init__(self, sinks: Optional[List[ResultSink]] = None, retain_results: bool = True):
         self.driver = BrowserDriver()
-        self.results = {}
+        self.sinks = sinks or []
+        # Runs that only stream to sinks keep step summaries without extracted payloads
+        self.retain_results = retain_results
+        self.deadline = Deadline()
     
     async def execute_task(self, task_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute task, profiling the run when the task config sets profile"""
+        if task_config.get("profile"):
+            from core.profiling import profile_run
+            
+            return await profile_run("task", self._execute_task(task_config))
+        return await self._execute_task(task_config)
+    
+    async def _execute_task(self, task_config: Dict[str, Any]) -> Dict[str, Any]:
         """Execute task"""
+        run = TaskRun(task_config.get("task_id"), self.sinks, self.retain_results)
+        capture = TraceCapture(task_config.get("trace"))
+        # Log records emitted during this run carry its task id
+        task_context = task_id_var.set(run.task_id)
+        step_context = step_id_var.set(None)
+        # Every phase of the task draws its timeout from one budget
+        self.deadline = Deadline(task_config.get("deadline_ms"))
+        start_time = time.perf_counter()
+        result = {"success": False, "error": "Task execution interrupted"}
+        
         try:
-            # Start browser
-            if not await self.driver.start():
-                return {"success": False, "error": "Failed to start browser"}
+            result = await asyncio.wait_for(
+                self._run_task(task_config, run, capture),
+                timeout=self.deadline.remaining_seconds()
+            )
+        except asyncio.TimeoutError:
+            logger.error("Task deadline of %sms exceeded", self.deadline.budget_ms)
+            result = {
+                "success": False,
+                "error": "Task deadline exceeded",
+                "results": run.to_dict()
+            }
+        except Exception as e:
+            logger.error("Task execution error: %s", e)
+            result = {"success": False, "error": str(e)}
+        finally:
+            result["task_id"] = run.task_id
+            result.update(run.stats)
+            if capture.recording:
+                duration_ms = (time.perf_counter() - start_time) * 1000
+                trace_info = await capture.finish(self.driver, result.get("success", False), duration_ms)
+                if trace_info:
+                    result["trace"] = trace_info
+            else:
+                await self.driver.close()
+            task_id_var.reset(task_context)
+            step_id_var.reset(step_context)
+        
+        return result
+    
+    async def _run_task(self, task_config: Dict[str, Any], run: TaskRun, capture: TraceCapture) -> Dict[str, Any]:
+        """Start the browser, navigate and run each step"""
+        steps = task_config.get("steps", [])
+        # Tasks that only read server-rendered elements are tried over plain HTTP first
+        mode = task_config.get("mode") or Config.TASK_MODE
+        if mode in ("static", "auto") and not capture.recording:
+            static_result = await self._run_static(task_config.get("url"), steps, mode, run)
+            if static_result:
+                return static_result
+        
+        # Serve cacheable static assets from the shared disk cache when enabled
+        route_handler = None
+        if task_config.get("asset_cache", Config.ASSET_CACHE_ENABLED):
+            run.stats["asset_cache"] = {"hits": 0, "misses": 0}
+            route_handler = get_asset_cache().route_handler(run.stats["asset_cache"])
+        
+        # Start browser
+        if not await self.driver.start(
+            trace=capture.recording,
+            har_path=capture.har_path,
+            route_handler=route_handler,
+            profile=task_config.get("browser_profile")
+        ):
+            return {"success": False, "error": "Failed to start browser"}
+        
+        # Navigate to target page
+        url = task_config.get("url")
+        if not await self.driver.navigate_to(url, timeout=self.deadline.cap(None)):
+            return {"success": False, "error": f"Cannot access URL: {url}"}
+        
+        # Execute task steps
+        if any(step.get("depends_on") or step.get("page") for step in steps):
+            return await self._run_graph(steps, url, run)
+        
+        for i, step in enumerate(steps):
+            step_id_var.set(f"step_{i}")
+            on_page = (lambda data: run.emit(StepResult.from_dict(i, data))) if self.sinks else None
+            step_result = StepResult.from_dict(i, await self._execute_step(step, on_page=on_page))
+            run.add(step_result)
             
-            # Navigate to target page
-            url = task_config.get("url")
-            if not await self.driver.navigate_to(url):
-                return {"success": False, "error": f"Cannot access URL: {url}"}
+            if not step_result.success:
+                return {
+                    "success": False, 
+                    "error": f"Step {i} execution failed: {step_result.error}",
+                    "results": run.to_dict()
+                }
+        
+        return {
+            "success": True,
+            "message": "Task execution successful",
+            "results": run.to_dict()
+        }
+    
+    async def _run_static(self, url: str, steps: List[Dict[str, Any]], mode: str, run: TaskRun) -> Optional[Dict[str, Any]]:
+        """Serve a wait/get_text-only task from fetched HTML, or return None to use the browser"""
+        from core.static_fetcher import static_fetcher, static_ineligibility
+        
+        reason = static_ineligibility(steps)
+        if reason:
+            if mode == "static":
+                return {"success": False, "error": f"Task cannot run without a browser: {reason}"}
+            return None
+        
+        results = await static_fetcher.run_steps(url, steps, self.deadline.cap(Config.STATIC_FETCH_TIMEOUT))
+        if results is None:
+            return None
+        
+        run.stats["mode"] = "static"
+        for i, data in enumerate(results):
+            run.add(StepResult.from_dict(i, data))
+        return {
+            "success": True,
+            "message": "Task execution successful",
+            "results": run.to_dict()
+        }
+    
+    async def _run_graph(self, steps: List[Dict[str, Any]], url: str, run: TaskRun) -> Dict[str, Any]:
+        """Run steps as a dependency graph, executing independent branches concurrently in separate tabs"""
+        # Steps may declare an "id", "depends_on" (step ids) and a "page" name. Steps on the same
+        # page run in order; named pages open on first use and close after their last step.
+        ids = [step.get("id") or f"step_{i}" for i, step in enumerate(steps)]
+        index_of = {}
+        for i, step_id in enumerate(ids):
+            if step_id in index_of:
+                return {"success": False, "error": f"Duplicate step id: {step_id}"}
+            index_of[step_id] = i
+        
+        # Explicit dependencies, plus the previous step on the same page
+        deps = []
+        page_names = []
+        last_on_page = {}
+        for i, step in enumerate(steps):
+            declared = step.get("depends_on") or []
+            if isinstance(declared, str):
+                declared = [declared]
+            step_deps = set()
+            for dep in declared:
+                if dep not in index_of:
+                    return {"success": False, "error": f"Step {i} depends on unknown step: {dep}"}
+                step_deps.add(index_of[dep])
             
-            # Execute task steps
-            steps = task_config.get("steps", [])
-            for i, step in enumerate(steps):
-                step_result = await self._execute_step(step)
-                self.results[f"step_{i}"] = step_result
+            page_name = step.get("page") or "main"
+            if page_name in last_on_page:
+                step_deps.add(last_on_page[page_name])
+            last_on_page[page_name] = i
+            deps.append(step_deps)
+            page_names.append(page_name)
+        
+        # Reject cycles before starting anything
+        remaining = {i: set(step_deps) for i, step_deps in enumerate(deps)}
+        while remaining:
+            ready = [i for i, step_deps in remaining.items() if not step_deps]
+            if not ready:
+                return {"success": False, "error": f"Dependency cycle between steps: {sorted(remaining)}"}
+            for i in ready:
+                del remaining[i]
+            for step_deps in remaining.values():
+                step_deps.difference_update(ready)
+        
+        pages = {"main": self.driver.page}
+        # 0 means unlimited; a task never has more named pages than steps
+        tab_slots = asyncio.Semaphore(Config.MAX_TABS_PER_TASK if Config.MAX_TABS_PER_TASK > 0 else len(steps))
+        holding = set()  # Named pages currently holding a tab slot
+        done = [asyncio.get_running_loop().create_future() for _ in steps]
+        
+        async def run_step(i: int):
+            # Each step runs in its own asyncio task, so this id stays local to it
+            step_id_var.set(ids[i])
+            page_name = page_names[i]
+            try:
+                same_page = [dep for dep in deps[i] if page_names[dep] == page_name]
+                other_pages = [dep for dep in deps[i] if page_names[dep] != page_name]
+                outcomes = {dep: await done[dep] for dep in same_page}
+                
+                # A page blocked on another page gives up its slot meanwhile, or that page may never get one
+                released = page_name in holding and any(not done[dep].done() for dep in other_pages)
+                if released:
+                    holding.discard(page_name)
+                    tab_slots.release()
+                outcomes.update({dep: await done[dep] for dep in other_pages})
+                if released:
+                    await tab_slots.acquire()
+                    holding.add(page_name)
                 
-                if not step_result.get("success", False):
-                    return {
-                        "success": False, 
-                        "error": f"Step {i} execution failed: {step_result.get('error')}",
-                        "results": self.results
-                    }
+                failed_deps = [ids[dep] for dep in sorted(deps[i]) if not outcomes[dep]]
+                if failed_deps:
+                    step_result = {"success": False, "error": f"Skipped: dependency {', '.join(failed_deps)} failed"}
+                else:
+                    if page_name not in pages:
+                        await tab_slots.acquire()
+                        holding.add(page_name)
+                        pages[page_name] = await self.driver.new_page()
+                        if pages[page_name] and steps[i].get("action") != "goto":
+                            await self.driver.navigate_to(url, page=pages[page_name], timeout=self.deadline.cap(None))
+                    if pages[page_name] is None:
+                        step_result = {"success": False, "error": f"Cannot open page: {page_name}"}
+                    else:
+                        on_page = (lambda data: run.emit(StepResult.from_dict(i, data))) if self.sinks else None
+                        step_result = await self._execute_step(steps[i], page=pages[page_name], on_page=on_page)
+            finally:
+                # Close a named tab after its last step so another branch can use the slot
+                if page_name != "main" and last_on_page[page_name] == i:
+                    if pages.get(page_name):
+                        await self.driver.close_page(pages[page_name])
+                    if page_name in holding:
+                        holding.discard(page_name)
+                        tab_slots.release()
             
+            record = StepResult.from_dict(i, step_result)
+            run.add(record)
+            done[i].set_result(record.success)
+        
+        await asyncio.gather(*(run_step(i) for i in range(len(steps))))
+        
+        failed = [f"step_{step.index}" for step in sorted(run.steps, key=lambda step: step.index) if not step.success]
+        if failed:
             return {
-                "success": True,
-                "message": "Task execution successful",
-                "results": self.results
+                "success": False,
+                "error": f"Steps failed: {', '.join(failed)}",
+                "results": run.to_dict()
             }
-            
-        except Exception as e:
-            logger.error(f"Task execution error: {e}")
-            return {"success": False, "error": str(e)}
-        finally:
-            await self.driver.close()
+        return {
+            "success": True,
+            "message": "Task execution successful",
+            "results": run.to_dict()
+        }
     
-    async def _execute_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute single step"""
+    async def _execute_step(self, step: Dict[str, Any], page=None, on_page: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Execute single step, on the task's main page unless another page is given"""
         action = step.get("action")
+        # The step's own timeout, or the browser default, never outlasts the task deadline
+        timeout = self.deadline.cap(step.get("timeout"))
         
         try:
-            if action == "click":
+            if action == "goto":
+                url = step.get("url")
+                if await self.driver.navigate_to(url, page=page, timeout=timeout):
+                    return {"success": True, "action": "goto", "url": url}
+                else:
+                    return {"success": False, "error": f"Cannot access URL: {url}"}
+            
+            elif action == "click":
                 selector = step.get("selector")
-                if await self.driver.click_element(selector):
+                if await self.driver.click_element(selector, page=page, timeout=timeout):
                     return {"success": True, "action": "click", "selector": selector}
                 else:
                     return {"success": False, "error": f"Click failed: {selector}"}
@@ -64,30 +285,34 @@ class TaskExecutor:
             elif action == "type":
                 selector = step.get("selector")
                 text = step.get("text")
-                if await self.driver.type_text(selector, text):
+                if await self.driver.type_text(selector, text, page=page, timeout=timeout):
                     return {"success": True, "action": "type", "selector": selector, "text": text}
                 else:
                     return {"success": False, "error": f"Type failed: {selector}"}
             
             elif action == "wait":
                 selector = step.get("selector")
-                timeout = step.get("timeout", 5000)
-                if await self.driver.wait_for_element(selector, timeout):
+                if await self.driver.wait_for_element(selector, self.deadline.cap(step.get("timeout", 5000)), page=page):
                     return {"success": True, "action": "wait", "selector": selector}
                 else:
                     return {"success": False, "error": f"Wait timeout: {selector}"}
             
             elif action == "get_text":
                 selector = step.get("selector")
-                text = await self.driver.get_text(selector)
+                text = await self.driver.get_text(selector, page=page, timeout=timeout)
                 if text is not None:
                     return {"success": True, "action": "get_text", "selector": selector, "text": text}
                 else:
                     return {"success": False, "error": f"Get text failed: {selector}"}
             
+            elif action == "paginate":
+                return await self._paginate(step, page, on_page)
+            
             elif action == "screenshot":
-                path = step.get("path", "screenshot.png")
-                if await self.driver.take_screenshot(path):
+                path = step.get("path") or "screenshot.png"
+                if step.get("change_key"):
+                    return await self._screenshot_if_changed(step, path, page, timeout)
+                if await self.driver.take_screenshot(path, page=page, timeout=timeout):
                     return {"success": True, "action": "screenshot", "path": path}
                 else:
                     return {"success": False, "error": "Screenshot failed"}
@@ -97,6 +322,111 @@ class TaskExecutor:
                 
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
+    async def _screenshot_if_changed(self, step: Dict[str, Any], path: str, page=None, timeout: Optional[int] = None) -> Dict[str, Any]:
+        """Store a screenshot only when it differs from the last one stored under the step's change_key"""
+        from core.screenshot_diff import get_change_detector
+        
+        data = await self.driver.capture_screenshot(page=page, timeout=timeout)
+        if data is None:
+            return {"success": False, "error": "Screenshot failed"}
+        
+        threshold = step.get("change_threshold")
+        if threshold is None:
+            threshold = Config.SCREENSHOT_CHANGE_THRESHOLD
+        change = await get_change_detector().check(step["change_key"], data, path, threshold)
+        return {
+            "success": True,
+            "action": "screenshot",
+            "path": change["path"],
+            "status": "changed" if change["changed"] else "unchanged",
+            "distance": change["distance"]
+        }
+    
+    async def _paginate(self, step: Dict[str, Any], page=None, on_page: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Repeat sub-steps on each page of a listing, following a next link or URL pattern"""
+        sub_steps = step.get("steps") or []
+        next_selector = step.get("next_selector")
+        url_pattern = step.get("url_pattern")
+        max_pages = step.get("max_pages") or 10
+        start_page = step.get("start_page") or 1
+        
+        if not sub_steps:
+            return {"success": False, "error": "Paginate requires steps"}
+        if any(sub_step.get("action") == "paginate" for sub_step in sub_steps):
+            return {"success": False, "error": "Nested paginate is not supported"}
+        if not next_selector and not url_pattern:
+            return {"success": False, "error": "Paginate requires next_selector or url_pattern"}
+        
+        # With sinks, pages are only streamed so long crawls keep flat memory; otherwise they are returned
+        pages = []
+        pages_visited = 0
+        seen = set()
+        stop_reason = "max_pages"
+        
+        for page_number in range(start_page, start_page + max_pages):
+            # The first page is the one already open; later ones are reached by the pattern or next link
+            if page_number > start_page:
+                if url_pattern:
+                    next_url = url_pattern.format(page=page_number)
+                    if not await self.driver.navigate_to(next_url, page=page, timeout=self.deadline.cap(None)):
+                        stop_reason = "no_next"
+                        break
+                    # Past the last page a pattern URL usually answers 404, on the main page or a named tab alike
+                    status = self.driver.status_of(page)
+                    if status and status >= 400:
+                        stop_reason = "no_next"
+                        break
+                else:
+                    if not await self.driver.wait_for_element(next_selector, self.deadline.cap(step.get("next_timeout") or 2000), page=page):
+                        stop_reason = "no_next"
+                        break
+                    if not await self.driver.click_element(next_selector, page=page, timeout=self.deadline.cap(None)):
+                        stop_reason = "no_next"
+                        break
+                    await self.driver.wait_for_load(page=page, timeout=self.deadline.cap(None))
+            
+            results = {}
+            for j, sub_step in enumerate(sub_steps):
+                results[f"step_{j}"] = await self._execute_step(sub_step, page)
+                if not results[f"step_{j}"]["success"]:
+                    break
+            page_success = all(result["success"] for result in results.values())
+            
+            # Stop when a page repeats content already extracted, e.g. a next link that stays on the last page
+            texts = [result.get("text") for result in results.values() if result.get("text")]
+            if texts:
+                fingerprint = hashlib.sha256(json.dumps(texts, ensure_ascii=False).encode("utf-8")).hexdigest()
+                if fingerprint in seen:
+                    stop_reason = "duplicate_content"
+                    break
+                seen.add(fingerprint)
+            
+            page_result = {"success": page_success, "action": "paginate", "page": page_number, "results": results}
+            if url_pattern and page_number > start_page:
+                page_result["url"] = next_url
+            pages_visited += 1
+            if on_page:
+                on_page(page_result)
+            else:
+                pages.append(page_result)
+            
+            if not page_success:
+                stop_reason = "step_failed"
+                break
+        
+        success = stop_reason != "step_failed"
+        result = {
+            "success": success,
+            "action": "paginate",
+            "pages_visited": pages_visited,
+            "stop_reason": stop_reason
+        }
+        if not on_page:
+            result["page_results"] = pages
+        if not success:
+            result["error"] = f"Page {page_number} failed"
+        return result
 
 # Example task configuration
 EXAMPLE_TASK = {
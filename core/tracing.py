@@ -0,0 +1,105 @@
+"""Sampled Playwright trace and HAR capture for slow or failed tasks"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Background artifact writers, kept referenced until they finish
+_pending_writes = set()
+
+def prune_artifacts(trace_dir: str, max_artifacts: int, suffixes: Tuple[str, ...] = (".zip", ".har")):
+    """Delete the oldest artifacts so at most max_artifacts remain"""
+    try:
+        paths = [
+            os.path.join(trace_dir, name)
+            for name in os.listdir(trace_dir)
+            if name.endswith(suffixes)
+        ]
+    except FileNotFoundError:
+        return
+    
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[max_artifacts:]:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to remove old artifact {path}: {e}")
+
+def _remove(path: str):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class TraceCapture:
+    """Decides whether to record a task and which recordings to keep"""
+    
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        options = options or {}
+        self.sample_rate = float(options.get("sample_rate", Config.TRACE_SAMPLE_RATE))
+        self.on_failure = bool(options.get("on_failure", Config.TRACE_ON_FAILURE))
+        self.slow_ms = int(options.get("slow_ms", Config.TRACE_SLOW_MS))
+        self.har = bool(options.get("har", Config.TRACE_HAR))
+        self.trace_dir = options.get("trace_dir", Config.TRACE_DIR)
+        self.max_artifacts = int(options.get("max_artifacts", Config.TRACE_MAX_ARTIFACTS))
+        
+        # Sampled runs are always kept; failure/slow capture has to record every run to decide afterwards
+        self.sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        self.recording = self.sampled or self.on_failure or self.slow_ms > 0
+        
+        self.trace_path = None
+        self.har_path = None
+        if self.recording:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            self.trace_path = os.path.join(self.trace_dir, f"{name}.zip")
+            if self.har:
+                self.har_path = os.path.join(self.trace_dir, f"{name}.har")
+    
+    def keep_reason(self, success: bool, duration_ms: float) -> Optional[str]:
+        """Why this run's recording should be kept, or None to discard it"""
+        if not success and self.on_failure:
+            return "failure"
+        if self.slow_ms > 0 and duration_ms >= self.slow_ms:
+            return "slow"
+        if self.sampled:
+            return "sampled"
+        return None
+    
+    async def finish(self, driver, success: bool, duration_ms: float) -> Optional[Dict[str, Any]]:
+        """Stop recording and close the driver; kept artifacts are written in the background"""
+        reason = self.keep_reason(success, duration_ms)
+        
+        if reason is None:
+            await driver.stop_tracing(None)
+            await driver.close()
+            if self.har_path:
+                await asyncio.to_thread(_remove, self.har_path)
+            return None
+        
+        logger.info(f"Keeping trace ({reason}, {duration_ms:.0f}ms): {self.trace_path}")
+        write = asyncio.create_task(self._write(driver.detach()))
+        _pending_writes.add(write)
+        write.add_done_callback(_pending_writes.discard)
+        
+        return {
+            "reason": reason,
+            "duration_ms": round(duration_ms),
+            "trace_path": self.trace_path,
+            "har_path": self.har_path
+        }
+    
+    async def _write(self, driver):
+        """Save the trace, flush the HAR by closing the context and apply retention"""
+        try:
+            await driver.stop_tracing(self.trace_path)
+        finally:
+            await driver.close()
+        await asyncio.to_thread(prune_artifacts, self.trace_dir, self.max_artifacts)
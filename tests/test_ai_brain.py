@@ -11,7 +11,33 @@ if sys.platform == 'win32':
 
 import pytest
 import asyncio
+from types import SimpleNamespace
 from ai_brain.task_planner import AITaskPlanner
+from ai_brain.llm_handler import LLMHandler, get_tier_stats
+from ai_brain.plan_repair import parse_plan_json, repair_plan
+from ai_brain.usage import TaskUsage, TenantLedger
+from ai_brain.template_library import TemplateLibrary, CONTENT_PLAN, PAGE_TITLE_PLAN
+
+class FakeCompletions:
+    """Fake OpenAI completions endpoint returning canned replies per model"""
+    
+    def __init__(self, replies):
+        self.replies = replies
+        self.models = []
+    
+    async def create(self, model, messages, temperature):
+        self.models.append(model)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.replies[model]))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+        )
+
+def make_handler(replies, tiers):
+    """Create an LLM handler backed by fake completions"""
+    handler = LLMHandler(model_tiers=tiers)
+    completions = FakeCompletions(replies)
+    handler.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return handler, completions
 
 @pytest.mark.asyncio
 async def test_ai_planner():
@@ -27,5 +53,227 @@ async def test_ai_planner():
     assert "success" in result
     print(f"AI task result: {result}")
 
+def test_tier_escalation_on_invalid_plan():
+    """Test that an invalid plan from the fast tier escalates to the next tier"""
+    handler, completions = make_handler(
+        {
+            "fast-model": '[{"action": "hover", "selector": "h1"}]',
+            "strong-model": '[{"action": "get_text", "selector": "h1"}]'
+        },
+        ["fast-model", "strong-model"]
+    )
+    
+    plan = asyncio.run(handler.generate_task_plan("Get page title", {}, []))
+    
+    assert plan == [{"action": "get_text", "selector": "h1"}]
+    # The fast tier gets one targeted correction request before escalating
+    assert completions.models == ["fast-model", "fast-model", "strong-model"]
+    assert handler.last_tier == 1
+    assert not handler.has_next_tier()
+    
+    handler.record_execution_result(True)
+    stats = get_tier_stats()
+    # The correction request is an extra call, not an extra attempt
+    assert stats["fast-model"]["calls"] == 2 and stats["fast-model"]["correction_calls"] == 1
+    assert stats["fast-model"]["attempts"] == 1 and stats["fast-model"]["failures"] == 1
+    assert stats["strong-model"]["success_rate"] == 1.0
+    assert stats["strong-model"]["prompt_tokens"] >= 10
+
+def test_fast_tier_used_when_plan_valid():
+    """Test that a valid plan from the fast tier is used without escalation"""
+    handler, completions = make_handler(
+        {"cheap-model": '[{"action": "wait", "selector": "body", "timeout": 5000}]'},
+        ["cheap-model", "expensive-model"]
+    )
+    
+    plan = asyncio.run(handler.generate_task_plan("Wait for page", {}, []))
+    
+    assert plan[0]["action"] == "wait"
+    assert completions.models == ["cheap-model"]
+    assert handler.has_next_tier()
+
+def test_llm_usage_per_task_and_tenant_budgets():
+    """Test that each call's tokens are recorded and tenant budgets downgrade, then reject"""
+    handler, completions = make_handler(
+        {"usage-model": '[{"action": "get_text", "selector": "h1"}]'},
+        ["usage-model"]
+    )
+    asyncio.run(handler.generate_task_plan("Get page title", {}, []))
+    
+    usage = handler.usage.to_dict()
+    assert usage["llm_calls"] == 1
+    assert usage["total_tokens"] == 15
+    assert usage["calls"][0]["model"] == "usage-model"
+    
+    ledger = TenantLedger(soft_tokens=20, max_tokens=40, window=3600)
+    assert ledger.check("secret-key") == "ok"
+    ledger.record("secret-key", handler.usage)
+    assert ledger.check("secret-key") == "ok"
+    ledger.record("secret-key", handler.usage)
+    assert ledger.check("secret-key") == "downgrade"
+    ledger.record("secret-key", handler.usage)
+    assert ledger.check("secret-key") == "reject"
+    assert ledger.check("other-key") == "ok"
+    
+    stats = ledger.get_stats()
+    assert "secret-key" not in stats
+    assert sum(entry["total_tokens"] for entry in stats.values()) == 45
+
+def test_template_library_matches_and_learns(tmp_path):
+    """Test offline goal matching against curated templates and learned, domain-specific plans"""
+    path = str(tmp_path / "templates.json")
+    library = TemplateLibrary(path=path)
+    
+    template, score = library.match("get page title", "https://example.com")
+    assert template["plan"] == PAGE_TITLE_PLAN
+    assert score > 0.9
+    assert library.match("book a flight to Paris next friday", "https://example.com") is None
+    # Generic plans only run for a near-exact goal, since they were never checked on this site
+    assert library.match("get quotes", "https://example.com") is None
+    assert library.match("get quotes", "https://example.com", curated_threshold=0.8)[0]["plan"] == CONTENT_PLAN
+    
+    plan = [{"action": "get_text", "selector": ".author-details"}]
+    asyncio.run(library.add("Get the author biography", plan, "https://www.quotes.example.com/author/1"))
+    template, _ = library.match("get author biography", "https://quotes.example.com/author/2")
+    assert template["plan"] == plan
+    assert library.match("get author biography", "https://other.example.com") is None
+    
+    reloaded = TemplateLibrary(path=path)
+    assert reloaded.get_stats()["learned"] == 1
+    assert reloaded.match("get the author biography", "https://quotes.example.com")[0]["plan"] == plan
+
+def test_parse_plan_repairs_json_defects():
+    """Test that code fences, single quotes and trailing commas are repaired locally"""
+    content = """Here is the plan:
+```json
+[
+    {'action': 'wait', 'selector': 'body', 'timeout': '5000',},
+    {'action': 'get_text', 'selector': 'h1',},
+]
+```"""
+    
+    plan = parse_plan_json(content)
+    
+    assert plan == [
+        {"action": "wait", "selector": "body", "timeout": "5000"},
+        {"action": "get_text", "selector": "h1"}
+    ]
+
+def test_repair_plan_normalizes_actions_and_selectors():
+    """Test that action aliases and element names are mapped onto executable steps"""
+    elements = [{"role": "textbox", "name": "Search", "selector": "input[name='q']"}]
+    # Elements past the ones shown in the prompt do not count as known
+    elements += [{"role": "link", "name": f"Link {i}", "selector": f"#link-{i}"} for i in range(25)]
+    plan = [
+        {"action": "Wait For Selector", "selector": "input[name='q']", "timeout": "3000"},
+        {"action": "fill", "selector": "Search", "text": "python"},
+        {"action": "wait", "selector": "body"},
+        {"action": "hover", "selector": "a"},
+        {"action": "click", "selector": "CSS selector"},
+        {"action": "click", "selector": ".made-up"},
+        {"action": "click", "selector": "#link-22"}
+    ]
+    
+    repaired, problems = repair_plan(plan, elements)
+    
+    assert repaired == [
+        {"action": "wait", "selector": "input[name='q']", "timeout": 3000},
+        {"action": "type", "selector": "input[name='q']", "text": "python"},
+        {"action": "wait", "selector": "body"}
+    ]
+    assert len(problems) == 4
+    assert "'.made-up'" in problems[2] and "'#link-22'" in problems[3]
+
+def test_batch_plans_parse_each_goal_separately():
+    """Test that one bad plan in a batch reply only sends that goal to the next tier"""
+    handler, completions = make_handler(
+        {
+            "batch-fast": """### Plan 1
+[{'action': 'get_text', 'selector': 'h1',}]
+### Plan 2
+I could not find a price on this page.
+### Plan 3
+```json
+[{"action": "wait", "selector": "body"}]
+```""",
+            "batch-strong": '### Plan 1\n[{"action": "get_text", "selector": ".price"}]'
+        },
+        ["batch-fast", "batch-strong"]
+    )
+    
+    plans = asyncio.run(handler.generate_batch_plans(["Get the title", "Get the price", "Wait for the page"], {}, []))
+    
+    assert plans == [
+        [{"action": "get_text", "selector": "h1"}],
+        [{"action": "get_text", "selector": ".price"}],
+        [{"action": "wait", "selector": "body"}]
+    ]
+    assert completions.models == ["batch-fast", "batch-strong"]
+    assert handler.usage.to_dict()["llm_calls"] == 2
+    
+    # Outcomes are recorded per goal against the tier that planned it
+    assert handler.batch_tiers == [0, 1, 0]
+    for tier in handler.batch_tiers:
+        handler.record_execution_result(True, tier=tier)
+    stats = get_tier_stats()
+    assert stats["batch-fast"]["attempts"] == 3 and stats["batch-fast"]["failures"] == 1
+    assert stats["batch-fast"]["successes"] == 2
+    assert stats["batch-strong"]["success_rate"] == 1.0
+
+def test_plan_execution_runs_inside_run_guard():
+    """Test that the planner holds its run guard (a browser admission slot in the API) while a plan runs"""
+    from contextlib import asynccontextmanager
+    
+    events = []
+    
+    @asynccontextmanager
+    async def guard():
+        events.append("enter")
+        yield
+        events.append("exit")
+    
+    class FakeExecutor:
+        async def execute_task(self, task_config):
+            events.append("run")
+            return {"success": True, "results": {}}
+    
+    planner = AITaskPlanner(run_guard=guard)
+    planner.task_executor = FakeExecutor()
+    result = asyncio.run(planner._execute_plan("https://example.com", [{"action": "wait", "selector": "body"}]))
+    
+    assert result["success"]
+    assert events == ["enter", "run", "exit"]
+
+def test_ai_endpoints_return_429_when_browser_queue_full(monkeypatch):
+    """Test that a full browser queue reaches the caller as 429 with Retry-After and still closes MCP"""
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+    from ai_brain.mcp_client import MCPClient
+    from core.admission import Limiter, admission
+    
+    full = Limiter("browser", 1, 0)
+    full.active = 1
+    monkeypatch.setitem(admission.limiters, "browser", full)
+    closed = []
+    
+    async def unavailable(self, url):
+        return None
+    
+    async def close(self):
+        closed.append(True)
+    
+    monkeypatch.setattr(MCPClient, "get_page_info", unavailable)
+    monkeypatch.setattr(MCPClient, "get_accessible_elements", unavailable)
+    monkeypatch.setattr(MCPClient, "close", close)
+    client = TestClient(api_main.app)
+    
+    response = client.post("/execute-ai-task", json={"goal": "Book a flight to Paris", "url": "https://example.com"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    
+    response = client.post("/execute-ai-batch", json={"goals": ["Book a flight to Paris"], "url": "https://example.com"})
+    assert response.status_code == 429
+    assert len(closed) == 2
+
 if __name__ == "__main__":
     asyncio.run(test_ai_planner())
@@ -11,7 +11,30 @@ if sys.platform == 'win32':
 
 import pytest
 import asyncio
+import functools
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 from core.task_executor import TaskExecutor
+from core.scheduler import DomainScheduler, TokenBucket
+from core.tracing import TraceCapture
+from core.results import JSONLSink, MemorySink, SQLiteSink, StepResult, TaskRun
+from core.asset_cache import AssetCache, parse_max_age
+from core.dry_run import DryRunValidator, SnapshotStore, dry_run
+from core.browser_driver import BrowserDriver
+from core.browser_pool import BrowserPool, _PooledBrowser, browser_pool, get_browser_pool
+from core.browser_profiles import resolve_profile, launch_options, context_options
+from core.result_cache import TaskResultCache, task_key
+from core.admission import AdmissionController, AdmissionRejected
+from core import screenshot_diff
+from core.recurring import CronSchedule, RecurringScheduler, load_job_specs
+from core.logging_config import SAMPLED, setup_logging, stop_logging, task_id_var
+from config import Config
 
 @pytest.mark.asyncio
 async def test_task_executor():
@@ -36,5 +59,763 @@ async def test_task_executor():
     assert "success" in result
     print(f"Task execution result: {result}")
 
+class FakeExecutor:
+    """Executor stand-in recording concurrency per domain"""
+    
+    active = {}
+    peak = {}
+    statuses = []
+    
+    def __init__(self):
+        status = FakeExecutor.statuses.pop(0) if FakeExecutor.statuses else 200
+        self.driver = SimpleNamespace(last_status=status)
+    
+    async def execute_task(self, task_config):
+        domain = task_config["url"]
+        FakeExecutor.active[domain] = FakeExecutor.active.get(domain, 0) + 1
+        FakeExecutor.peak[domain] = max(FakeExecutor.peak.get(domain, 0), FakeExecutor.active[domain])
+        await asyncio.sleep(0.01)
+        FakeExecutor.active[domain] -= 1
+        return {"success": True, "url": domain}
+
+def test_token_bucket():
+    """Test token bucket burst and refill"""
+    bucket = TokenBucket(rate=1000.0, capacity=2)
+    assert bucket.consume()
+    assert bucket.consume()
+    assert not bucket.consume()
+    assert bucket.time_until_available() > 0
+
+def test_scheduler_domain_limits_and_backoff():
+    """Test per-domain concurrency caps and retry after a 429 response"""
+    FakeExecutor.active, FakeExecutor.peak = {}, {}
+    FakeExecutor.statuses = [429]
+    scheduler = DomainScheduler(
+        max_concurrency=10,
+        domain_concurrency=2,
+        domain_rate=0,
+        domain_burst=1,
+        backoff_base=0.01,
+        max_retries=1,
+        executor_factory=FakeExecutor
+    )
+    tasks = [{"url": "https://a.example/"} for _ in range(6)] + [{"url": "https://b.example/"}]
+    
+    async def run():
+        results = await scheduler.run_all(tasks)
+        await scheduler.close()
+        return results
+    
+    results = asyncio.run(run())
+    
+    assert all(result["success"] for result in results)
+    assert [result["url"] for result in results] == [task["url"] for task in tasks]
+    assert FakeExecutor.peak["https://a.example/"] <= 2
+    assert scheduler.get_stats()["domains"]["a.example"]["throttled"] == 1
+
+def test_trace_capture_sampling(tmp_path):
+    """Test which runs are recorded and which recordings are kept"""
+    disabled = TraceCapture({"sample_rate": 0, "on_failure": False, "slow_ms": 0})
+    assert not disabled.recording
+    
+    capture = TraceCapture({
+        "sample_rate": 0,
+        "on_failure": True,
+        "slow_ms": 1000,
+        "har": True,
+        "trace_dir": str(tmp_path)
+    })
+    assert capture.recording
+    assert capture.har_path.endswith(".har")
+    assert capture.keep_reason(success=False, duration_ms=10) == "failure"
+    assert capture.keep_reason(success=True, duration_ms=1500) == "slow"
+    assert capture.keep_reason(success=True, duration_ms=10) is None
+    
+    sampled = TraceCapture({"sample_rate": 1.0, "trace_dir": str(tmp_path)})
+    assert sampled.keep_reason(success=True, duration_ms=10) == "sampled"
+
+class FakeDriver:
+    """Browser driver stand-in serving text for known selectors"""
+    
+    def __init__(self, texts=None):
+        self.texts = texts or {}
+        self.last_status = 200
+        self.page = "main"
+        self.pages = {}
+        self.open_pages = 0
+        self.peak_pages = 0
+        self.timeouts = []
+        self.url_statuses = {}
+    
+    async def start(self, **kwargs):
+        return True
+    
+    async def navigate_to(self, url, page=None, timeout=None):
+        self.pages[page or self.page] = url
+        return True
+    
+    def status_of(self, page=None):
+        return self.url_statuses.get(self.pages.get(page or self.page), 200)
+    
+    async def new_page(self):
+        self.open_pages += 1
+        self.peak_pages = max(self.peak_pages, self.open_pages)
+        return f"tab_{len(self.pages)}"
+    
+    async def close_page(self, page):
+        self.open_pages -= 1
+    
+    async def wait_for_element(self, selector, timeout=5000, page=None):
+        self.timeouts.append(timeout)
+        return selector in self.texts
+    
+    async def get_text(self, selector, page=None, timeout=None):
+        self.timeouts.append(timeout)
+        await asyncio.sleep(0.05)
+        return self.texts.get(f"{self.pages.get(page or self.page)} {selector}", self.texts.get(selector))
+    
+    async def capture_screenshot(self, page=None, timeout=None):
+        return self.texts.get("screenshot")
+    
+    async def close(self):
+        pass
+
+def test_task_results_do_not_leak_between_runs():
+    """Test that each execute_task call gets a fresh result set"""
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Title", "p": "Body"})
+    
+    first = asyncio.run(executor.execute_task({
+        "url": "https://example.com",
+        "steps": [{"action": "get_text", "selector": "h1"}, {"action": "get_text", "selector": "p"}]
+    }))
+    second = asyncio.run(executor.execute_task({
+        "url": "https://example.com",
+        "steps": [{"action": "get_text", "selector": "p"}]
+    }))
+    
+    assert list(first["results"]) == ["step_0", "step_1"]
+    assert second["results"] == {"step_0": {"success": True, "action": "get_text", "selector": "p", "text": "Body"}}
+    assert first["task_id"] != second["task_id"]
+
+def test_task_deadline_caps_steps_and_returns_partial_results():
+    """Test that step timeouts draw from the task deadline and overruns cancel the task"""
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Title"})
+    
+    result = asyncio.run(executor.execute_task({
+        "url": "https://example.com",
+        "deadline_ms": 120,
+        "steps": [{"action": "wait", "selector": "h1", "timeout": 5000}] + [{"action": "get_text", "selector": "h1"}] * 5
+    }))
+    
+    assert not result["success"]
+    assert result["error"] == "Task deadline exceeded"
+    assert 1 <= len(result["results"]) < 6
+    assert all(timeout <= 120 for timeout in executor.driver.timeouts)
+    
+    unbounded = TaskExecutor()
+    unbounded.driver = FakeDriver({"h1": "Title"})
+    asyncio.run(unbounded.execute_task({"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1"}]}))
+    assert unbounded.driver.timeouts == [None]
+
+def test_paginate_streams_pages_until_duplicate_content():
+    """Test that paginate follows a URL pattern in one session and stops on repeated content"""
+    executor = TaskExecutor(sinks=[MemorySink()])
+    executor.driver = FakeDriver({
+        ".quote": "placeholder",
+        "https://example.com/page/1/ .quote": "Quote 1",
+        "https://example.com/page/2/ .quote": "Quote 2",
+        "https://example.com/page/3/ .quote": "Quote 2"
+    })
+    
+    result = asyncio.run(executor.execute_task({
+        "url": "https://example.com/page/1/",
+        "steps": [{
+            "action": "paginate",
+            "url_pattern": "https://example.com/page/{page}/",
+            "max_pages": 5,
+            "steps": [{"action": "get_text", "selector": ".quote"}]
+        }]
+    }))
+    
+    step = result["results"]["step_0"]
+    assert result["success"]
+    assert step["pages_visited"] == 2
+    assert step["stop_reason"] == "duplicate_content"
+    # Pages reach the sink once each; the final result carries no page payloads
+    assert "page_results" not in step
+    streamed = [(record.extra.get("page"), record.extra.get("results")) for _, record in executor.sinks[0].items]
+    assert [page for page, _ in streamed] == [1, 2, None]
+    assert [results["step_0"]["text"] for _, results in streamed[:2]] == ["Quote 1", "Quote 2"]
+    assert streamed[2][1] is None
+    
+    # Without sinks the pages are returned with the step result
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"https://example.com/page/1/ .quote": "Quote 1"})
+    result = asyncio.run(executor.execute_task({
+        "url": "https://example.com/page/1/",
+        "steps": [{"action": "paginate", "url_pattern": "https://example.com/page/{page}/", "max_pages": 2, "steps": [{"action": "get_text", "selector": ".quote"}]}]
+    }))
+    step = result["results"]["step_0"]
+    assert step["stop_reason"] == "step_failed"
+    assert [page["page"] for page in step["page_results"]] == [1, 2]
+    
+    # On a named tab, a 404 past the last page ends pagination instead of being scraped
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({".quote": "Not found", "https://example.com/page/1/ .quote": "Quote 1"})
+    executor.driver.url_statuses["https://example.com/page/2/"] = 404
+    result = asyncio.run(executor.execute_task({
+        "url": "https://example.com",
+        "steps": [
+            {"action": "goto", "url": "https://example.com/page/1/", "page": "list"},
+            {"action": "paginate", "url_pattern": "https://example.com/page/{page}/", "max_pages": 3, "page": "list",
+             "steps": [{"action": "get_text", "selector": ".quote"}]}
+        ]
+    }))
+    step = result["results"]["step_1"]
+    assert result["success"]
+    assert step["stop_reason"] == "no_next"
+    assert [page["results"]["step_0"]["text"] for page in step["page_results"]] == ["Quote 1"]
+
+def test_profiled_task_writes_artifact(tmp_path, monkeypatch):
+    """Test that only tasks with the profile flag are profiled and return the artifact path"""
+    monkeypatch.setattr(Config, "PROFILE_DIR", str(tmp_path))
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Title"})
+    task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1"}]}
+    
+    profiled = asyncio.run(executor.execute_task({**task, "profile": True}))
+    plain = asyncio.run(executor.execute_task(task))
+    
+    assert profiled["success"]
+    assert os.path.exists(profiled["profile"])
+    assert "profile" not in plain
+
+def test_static_mode_serves_html_and_falls_back_to_browser():
+    """Test that read-only tasks run over HTTP and fall back to the browser when a selector is missing"""
+    fixtures = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures")
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=fixtures)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+    
+    async def run_tasks():
+        from core.static_fetcher import static_fetcher
+        
+        executor = TaskExecutor()
+        executor.driver = FakeDriver({".rendered": "From browser"})
+        try:
+            static = await executor.execute_task({"url": url, "mode": "auto", "steps": [
+                {"action": "wait", "selector": "h1"},
+                {"action": "get_text", "selector": ".quote .author"}
+            ]})
+            fallback = await executor.execute_task({"url": url, "mode": "auto", "steps": [
+                {"action": "wait", "selector": ".rendered"},
+                {"action": "get_text", "selector": ".rendered"}
+            ]})
+            refused = await executor.execute_task({"url": url, "mode": "static", "steps": [
+                {"action": "click", "selector": "button"}
+            ]})
+        finally:
+            await static_fetcher.close()
+        return static, fallback, refused
+    
+    try:
+        static, fallback, refused = asyncio.run(run_tasks())
+    finally:
+        server.shutdown()
+    
+    assert static["mode"] == "static"
+    assert static["results"]["step_1"] == {"success": True, "action": "get_text", "selector": ".quote .author", "text": "Albert Einstein"}
+    assert "mode" not in fallback
+    assert fallback["results"]["step_1"]["text"] == "From browser"
+    assert not refused["success"]
+    assert "needs a browser" in refused["error"]
+
+def test_result_cache_coalesces_and_serves_hits():
+    """Test that identical read-only tasks share one run, later copies hit the cache and clicks bypass it"""
+    cache = TaskResultCache(ttl=60, max_entries=2)
+    runs = []
+    
+    async def execute():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"success": True, "results": {"step_0": {"success": True, "text": "Title"}}}
+    
+    read_task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1", "description": "Title"}]}
+    same_task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1", "description": None}]}
+    click_task = {"url": "https://example.com", "steps": [{"action": "click", "selector": "button"}]}
+    
+    async def scenario():
+        first, second = await asyncio.gather(cache.run(read_task, execute), cache.run(same_task, execute))
+        first[0]["results"]["step_0"]["text"] = "Changed"
+        third = await cache.run(read_task, execute)
+        fourth = await cache.run(click_task, execute)
+        return [first[1], second[1], third[1], fourth[1]], third[0]
+    
+    statuses, cached = asyncio.run(scenario())
+    
+    assert statuses == ["miss", "coalesced", "hit", "bypass"]
+    assert len(runs) == 2
+    assert cached["results"]["step_0"]["text"] == "Title"
+
+def test_admission_prefers_interactive_lane_and_rejects_when_full():
+    """Test that queued interactive requests go before bulk ones and a full queue is rejected with a retry hint"""
+    controller = AdmissionController(max_browser_sessions=1, max_ai_tasks=1, max_queue=2)
+    order = []
+    
+    async def hold(name, lane, bounded=True):
+        async with controller.admit("browser", lane, bounded):
+            order.append(name)
+            await asyncio.sleep(0.01)
+    
+    async def scenario():
+        first = asyncio.create_task(hold("first", "interactive"))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(hold("bulk", "bulk")), asyncio.create_task(hold("interactive", "interactive"))]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await hold("overflow", "interactive")
+        # Batch tasks wait beyond the queue limit instead of being rejected
+        waiting.append(asyncio.create_task(hold("batch", "bulk", bounded=False)))
+        await asyncio.gather(first, *waiting)
+        return rejected.value
+    
+    rejected = asyncio.run(scenario())
+    stats = controller.get_stats()["browser"]
+    
+    assert order == ["first", "interactive", "bulk", "batch"]
+    assert rejected.retry_after >= 1
+    assert stats["rejected"]["interactive"] == 1
+    assert stats["active"] == 0 and stats["queued"] == {"interactive": 0, "bulk": 0}
+
+def test_screenshot_stored_only_when_changed(tmp_path, monkeypatch):
+    """Test that a screenshot with a change_key is written on first sight and on change, and skipped when identical"""
+    monkeypatch.setattr(screenshot_diff, "_change_detector", screenshot_diff.ScreenshotChangeDetector(str(tmp_path / "hashes.json")))
+    executor = TaskExecutor()
+    task = {"url": "https://example.com", "steps": [{"action": "screenshot", "path": None, "change_key": "home"}]}
+    statuses = []
+    
+    for i, image in enumerate([b"frame-a", b"frame-a", b"frame-b"]):
+        executor.driver = FakeDriver({"screenshot": image})
+        task["steps"][0]["path"] = str(tmp_path / f"shot_{i}.png")
+        result = asyncio.run(executor.execute_task(task))
+        statuses.append((result["results"]["step_0"]["status"], os.path.basename(result["results"]["step_0"]["path"])))
+    
+    assert statuses == [("changed", "shot_0.png"), ("unchanged", "shot_0.png"), ("changed", "shot_2.png")]
+    assert sorted(os.listdir(tmp_path)) == ["hashes.json", "shot_0.png", "shot_2.png"]
+    assert screenshot_diff.get_change_detector_stats() == {"keys": 1, "changed": 2, "unchanged": 1}
+
+def test_dhash_tolerates_small_changes():
+    """Test that a slightly altered image stays within the change threshold while a different one does not"""
+    Image = pytest.importorskip("PIL.Image")
+    
+    def png(pixels):
+        image = Image.new("L", (64, 64))
+        image.putdata(pixels)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    
+    gradient = [x * 4 for _ in range(64) for x in range(64)]
+    tweaked = list(gradient)
+    tweaked[0] = 255
+    reversed_gradient = [255 - value for value in gradient]
+    
+    base = screenshot_diff.fingerprint(png(gradient))
+    assert base[0] == "dhash"
+    assert screenshot_diff.distance("dhash", base[1], screenshot_diff.fingerprint(png(tweaked))[1]) <= 5
+    assert screenshot_diff.distance("dhash", base[1], screenshot_diff.fingerprint(png(reversed_gradient))[1]) > 5
+
+def test_cron_schedule_finds_next_run():
+    """Test cron fields, steps and the day-of-month or day-of-week rule"""
+    from datetime import datetime
+    
+    assert CronSchedule("*/15 9-17 * * *").next_after(datetime(2024, 3, 1, 17, 50)) == datetime(2024, 3, 2, 9, 0)
+    assert CronSchedule("0 0 1 * *").next_after(datetime(2024, 1, 31, 12, 0)) == datetime(2024, 2, 1, 0, 0)
+    # 2024-03-04 is a Monday (cron weekday 1), earlier than the 15th
+    assert CronSchedule("30 6 15 * 1").next_after(datetime(2024, 3, 1, 0, 0)) == datetime(2024, 3, 4, 6, 30)
+    # Both 0 and 7 are Sunday (2024-03-03)
+    assert CronSchedule("0 9 * * 7").next_after(datetime(2024, 3, 1, 0, 0)) == datetime(2024, 3, 3, 9, 0)
+    assert CronSchedule("0 9 * * 0").next_after(datetime(2024, 3, 1, 0, 0)) == datetime(2024, 3, 3, 9, 0)
+    with pytest.raises(ValueError):
+        CronSchedule("61 * * * *")
+
+def test_recurring_job_emits_diffs_and_skips_overlaps(tmp_path):
+    """Test that runs emit only changed values, persist them and never overlap"""
+    pages = iter([
+        {"h1": "Price: 10", "p": "In stock"},
+        {"h1": "Price: 10", "p": "In stock"},
+        {"h1": "Price: 12", "p": "In stock"}
+    ])
+    
+    def make_executor():
+        executor = TaskExecutor()
+        executor.driver = FakeDriver(next(pages))
+        return executor
+    
+    events = []
+    task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1"}, {"action": "get_text", "selector": "p"}]}
+    state_path = str(tmp_path / "state.json")
+    
+    jobs_path = tmp_path / "jobs.json"
+    jobs_path.write_text(json.dumps([{"name": "price", "task": task, "interval": 0.5}]), encoding="utf-8")
+    
+    async def scenario():
+        recurring = RecurringScheduler(on_change=events.append, state_path=state_path, executor_factory=make_executor)
+        recurring.add_jobs(load_job_specs(str(jobs_path)))
+        for _ in range(3):
+            await recurring.run_job("price")
+        
+        # A run that outlasts the interval makes the next firing skip
+        slow = RecurringScheduler(state_path=None, executor_factory=lambda: SlowExecutor())
+        job = slow.add("slow", task, interval=0.02)
+        slow.start()
+        await asyncio.sleep(0.15)
+        await slow.close()
+        return job
+    
+    class SlowExecutor:
+        async def execute_task(self, task_config):
+            await asyncio.sleep(0.1)
+            return {"success": True, "results": {}}
+    
+    slow_job = asyncio.run(scenario())
+    
+    assert [event["diff"] for event in events] == [
+        {"added": {"step_0": "Price: 10", "step_1": "In stock"}},
+        {"changed": {"step_0": {"old": "Price: 10", "new": "Price: 12"}}}
+    ]
+    with open(state_path, encoding="utf-8") as f:
+        assert json.load(f)["price"]["step_0"] == "Price: 12"
+    assert slow_job.runs >= 1 and slow_job.overlaps >= 1
+
+def test_result_sinks_stream_steps(tmp_path):
+    """Test that step results stream to sinks while the run keeps only summaries"""
+    memory = MemorySink(max_items=1)
+    jsonl = JSONLSink(str(tmp_path / "results.jsonl"))
+    sqlite = SQLiteSink(str(tmp_path / "results.db"))
+    run = TaskRun("task-1", [memory, jsonl, sqlite], retain=False)
+    
+    run.add(StepResult.from_dict(0, {"success": True, "action": "get_text", "selector": "h1", "text": "x" * 1000}))
+    run.add(StepResult.from_dict(1, {"success": False, "error": "Get text failed: p"}))
+    jsonl.close()
+    sqlite.close()
+    
+    assert "text" not in run.to_dict()["step_0"]
+    assert run.to_dict()["step_1"] == {"success": False, "error": "Get text failed: p"}
+    assert len(memory.items) == 1
+    assert len((tmp_path / "results.jsonl").read_text(encoding="utf-8").splitlines()) == 2
+    
+    rows = sqlite3.connect(str(tmp_path / "results.db")).execute("SELECT step, text FROM step_results").fetchall()
+    assert rows == [(0, "x" * 1000), (1, None)]
+
+def test_asset_cache_freshness_and_lru(tmp_path):
+    """Test Cache-Control handling and size-bounded LRU eviction"""
+    assert parse_max_age({"cache-control": "public, max-age=3600"}) == 3600
+    assert parse_max_age({"cache-control": "no-store"}) is None
+    assert parse_max_age({"cache-control": "private, max-age=60"}) is None
+    assert parse_max_age({}) is None
+    
+    cache = AssetCache(str(tmp_path), max_bytes=10)
+    headers = {"content-type": "text/css", "content-encoding": "gzip"}
+    cache.put("https://a.example/a.css", 200, headers, b"aaaa", 60)
+    cache.put("https://a.example/b.css", 200, headers, b"bbbb", 60)
+    assert cache.get("https://a.example/a.css")[2] == b"aaaa"  # a is now most recently used
+    cache.put("https://a.example/c.css", 200, headers, b"cccc", 60)
+    
+    assert cache.get("https://a.example/b.css") is None
+    status, stored_headers, body = cache.get("https://a.example/c.css")
+    assert (status, body) == (200, b"cccc")
+    assert "content-encoding" not in stored_headers
+    
+    # Entries survive a restart through the on-disk index
+    reloaded = AssetCache(str(tmp_path), max_bytes=10)
+    assert reloaded.get("https://a.example/a.css")[2] == b"aaaa"
+    assert reloaded.total_bytes == 8
+
+SNAPSHOT_HTML = """
+<html><body>
+    <h1>Quotes</h1>
+    <form><input type="search" name="q"><button type="submit">Go</button></form>
+    <div class="quote"><span class="text">Hello</span></div>
+</body></html>
+"""
+
+def test_dry_run_reports_failing_steps():
+    """Test offline selector checks against a DOM snapshot"""
+    validator = DryRunValidator(SNAPSHOT_HTML)
+    
+    report = validator.validate([
+        {"action": "wait", "selector": ".quote"},
+        {"action": "type", "selector": "h1", "text": "x"},
+        {"action": "get_text", "selector": ".missing"},
+        {"action": "get_text", "selector": "text=Quotes"},
+        {"action": "click", "selector": "button[type='submit']"},
+        {"action": "get_text", "selector": ".results"},
+        {"action": "hover", "selector": "h1"}
+    ])
+    
+    statuses = [step["status"] for step in report["steps"]]
+    assert statuses == ["ok", "fail", "fail", "unverified", "ok", "unverified", "fail"]
+    assert report["failed_steps"] == [1, 2, 6]
+    assert not report["success"]
+    
+    report = validator.validate([
+        {"action": "goto", "url": "https://quotes.toscrape.com/page/2/"},
+        {"action": "get_text", "selector": ".next-page-only"}
+    ])
+    assert [step["status"] for step in report["steps"]] == ["ok", "unverified"]
+
+def test_dry_run_uses_stored_snapshot(tmp_path):
+    """Test that stored snapshots are reused without launching a browser"""
+    store = SnapshotStore(str(tmp_path))
+    store.save("https://example.com", SNAPSHOT_HTML)
+    
+    result = asyncio.run(dry_run(
+        "https://example.com",
+        [[{"action": "type", "selector": "input[name='q']", "text": "python"}]],
+        store=store
+    ))
+    
+    assert result["success"]
+    assert result["reports"][0]["success"]
+
+def test_step_graph_runs_branches_in_parallel_tabs():
+    """Test that independent branches on separate pages run concurrently"""
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Home", "https://example.com/a h2": "A", "https://example.com/b h2": "B"})
+    steps = [{"action": "get_text", "selector": "h1", "id": "title"}]
+    for name in ["a", "b", "c"]:
+        steps.append({"action": "goto", "url": f"https://example.com/{name}", "page": name, "depends_on": ["title"]})
+        steps.append({"action": "get_text", "selector": "h2", "page": name})
+    
+    start_time = time.perf_counter()
+    result = asyncio.run(executor.execute_task({"url": "https://example.com", "steps": steps}))
+    elapsed = time.perf_counter() - start_time
+    
+    assert result["results"]["step_2"]["text"] == "A"
+    assert result["results"]["step_4"]["text"] == "B"
+    # The page "c" branch fails without affecting the others
+    assert result["error"] == "Steps failed: step_6"
+    assert list(result["results"]) == [f"step_{i}" for i in range(7)]
+    # Two sequential get_text calls per branch, not six
+    assert elapsed < 0.25
+    assert executor.driver.open_pages == 0
+
+def test_step_graph_cross_page_dependency_with_one_tab_slot(monkeypatch):
+    """Test that a page waiting on another page frees its tab slot instead of deadlocking"""
+    monkeypatch.setattr(Config, "MAX_TABS_PER_TASK", 1)
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Home", "h2": "Other"})
+    
+    async def run():
+        return await asyncio.wait_for(executor.execute_task({"url": "https://example.com", "steps": [
+            {"action": "get_text", "selector": "h1", "id": "a1", "page": "a"},
+            {"action": "get_text", "selector": "h1", "id": "a2", "page": "a", "depends_on": ["b1"]},
+            {"action": "get_text", "selector": "h2", "id": "b1", "page": "b"}
+        ]}), timeout=5)
+    
+    result = asyncio.run(run())
+    
+    assert result["success"]
+    assert result["results"]["step_1"]["text"] == "Home"
+    assert executor.driver.open_pages == 0
+
+def test_step_graph_treats_zero_tab_limit_as_unlimited(monkeypatch):
+    """Test that MAX_TABS_PER_TASK=0 runs named pages instead of blocking on a zero-slot semaphore"""
+    monkeypatch.setattr(Config, "MAX_TABS_PER_TASK", 0)
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Home", "h2": "Other"})
+    
+    async def run():
+        return await asyncio.wait_for(executor.execute_task({"url": "https://example.com", "steps": [
+            {"action": "get_text", "selector": "h1", "page": "a"},
+            {"action": "get_text", "selector": "h2", "page": "b"}
+        ]}), timeout=5)
+    
+    result = asyncio.run(run())
+    
+    assert result["success"]
+    assert executor.driver.peak_pages == 2
+
+def test_step_graph_skips_dependents_and_rejects_cycles():
+    """Test dependency failure propagation and cycle detection"""
+    executor = TaskExecutor()
+    executor.driver = FakeDriver({"h1": "Home"})
+    
+    result = asyncio.run(executor.execute_task({"url": "https://example.com", "steps": [
+        {"action": "get_text", "selector": ".missing", "id": "first"},
+        {"action": "get_text", "selector": "h1", "page": "other", "depends_on": ["first"]}
+    ]}))
+    assert result["results"]["step_1"]["error"] == "Skipped: dependency first failed"
+    
+    result = asyncio.run(executor.execute_task({"url": "https://example.com", "steps": [
+        {"action": "get_text", "selector": "h1", "id": "a", "depends_on": ["b"]},
+        {"action": "get_text", "selector": "h1", "id": "b", "depends_on": ["a"]}
+    ]}))
+    assert result["error"].startswith("Dependency cycle")
+
+class FakeBrowser:
+    """Browser stand-in for pool recycling tests"""
+    
+    def __init__(self):
+        self.closed = False
+        self.contexts = []
+    
+    def is_connected(self):
+        return not self.closed
+    
+    async def close(self):
+        self.closed = True
+
+def test_browser_pool_recycles_after_task_limit(monkeypatch):
+    """Test that a browser is retired after N tasks and closed once drained"""
+    monkeypatch.setattr(Config, "BROWSER_RECYCLE_TASKS", 2)
+    monkeypatch.setattr(Config, "BROWSER_WATCHDOG_INTERVAL", 0)
+    pool = BrowserPool()
+    launched = []
+    
+    async def fake_get_browser():
+        if pool.current is None:
+            launched.append(FakeBrowser())
+            pool.current = _PooledBrowser(launched[-1], len(launched))
+        return pool.current.browser
+    
+    pool.get_browser = fake_get_browser
+    
+    async def run():
+        first = await pool.acquire()
+        second = await pool.acquire()  # Last task for this browser
+        assert pool.current is None and pool.retiring
+        third = await pool.acquire()  # Served by a fresh browser
+        assert third is not first
+        
+        await pool.release(first)
+        assert not first.closed  # Still draining the second task
+        await pool.release(second)
+        assert first.closed
+        await pool.release(third)
+    
+    asyncio.run(run())
+    
+    stats = pool.get_stats()
+    assert stats["recycles"]["tasks"] == 1
+    assert stats["retiring"] == 0
+    assert len(launched) == 2
+
+def test_browser_pool_memory_check_counts_only_its_own_processes(monkeypatch):
+    """Test that the memory watchdog measures each pool's own driver tree and recycles only that pool"""
+    monkeypatch.setattr(Config, "BROWSER_RECYCLE_RSS_MB", 1000)
+    monkeypatch.setattr("core.browser_pool.measure_tree_rss_mb", lambda pid, include_root=False: {1: 1500.0, 2: 300.0}[pid])
+    heavy, light = BrowserPool("firefox"), BrowserPool()
+    heavy.driver_pid, light.driver_pid = 1, 2
+    heavy.current = _PooledBrowser(FakeBrowser(), 1)
+    light.current = _PooledBrowser(FakeBrowser(), 1)
+    
+    async def ping():
+        return FakeBrowser()
+    
+    async def run():
+        await heavy.check()
+        await light.check()
+        await asyncio.sleep(0)
+    
+    light.current.browser.new_context = ping
+    asyncio.run(run())
+    
+    assert heavy.get_stats()["recycles"]["memory"] == 1 and heavy.last_rss_mb == 1500.0
+    assert light.get_stats()["recycles"]["memory"] == 0 and light.current is not None
+
+def test_browser_pool_memory_check_waits_for_retiring_browsers(monkeypatch):
+    """Test that a draining browser's memory does not get the fresh browser recycled"""
+    monkeypatch.setattr(Config, "BROWSER_RECYCLE_RSS_MB", 1000)
+    monkeypatch.setattr("core.browser_pool.measure_tree_rss_mb", lambda pid, include_root=False: 1500.0)
+    pool = BrowserPool()
+    pool.driver_pid = 1
+    draining = _PooledBrowser(FakeBrowser(), 1)
+    draining.leases = 1
+    pool.retiring = [draining]
+    pool.current = _PooledBrowser(FakeBrowser(), 2)
+    
+    async def ping():
+        return FakeBrowser()
+    
+    pool.current.browser.new_context = ping
+    asyncio.run(pool.check())
+    
+    assert pool.current is not None and pool.recycles["memory"] == 0
+    
+    # Once the old browser is gone, the same reading recycles the current one
+    pool.retiring = []
+    asyncio.run(pool.check())
+    assert pool.current is None and pool.recycles["memory"] == 1
+
+def test_browser_driver_close_releases_lease_when_context_close_fails():
+    """Test that a pooled driver returns its lease even if closing its context raises"""
+    pool = BrowserPool()
+    browser = FakeBrowser()
+    pool.current = _PooledBrowser(browser, 1)
+    pool.current.leases = 1
+    
+    class BrokenContext:
+        async def close(self):
+            raise RuntimeError("Target closed")
+    
+    driver = BrowserDriver()
+    driver.owns_browser, driver.pool, driver.browser, driver.context = False, pool, browser, BrokenContext()
+    asyncio.run(driver.close())
+    
+    assert pool.current.leases == 0
+    assert driver.browser is None
+
+def test_browser_profiles_select_engine_options_and_pool():
+    """Test that launch profiles resolve to launch and context options and get their own shared pool"""
+    name, profile = resolve_profile("no_js")
+    
+    assert name == "no_js" and profile["engine"] == "chromium"
+    assert "--disable-gpu" in launch_options(profile)["args"]
+    assert context_options(profile) == {"viewport": {"width": 1024, "height": 768}, "java_script_enabled": False}
+    assert "args" not in launch_options(resolve_profile("webkit")[1])
+    with pytest.raises(ValueError):
+        resolve_profile("netscape")
+    
+    assert get_browser_pool() is browser_pool
+    assert get_browser_pool("firefox") is get_browser_pool("firefox")
+    assert get_browser_pool("firefox").profile == "firefox"
+    
+    task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1"}]}
+    assert task_key(task) != task_key({**task, "browser_profile": "no_js"})
+
+def test_task_key_separates_static_and_browser_runs(monkeypatch):
+    """Test that static and browser runs of the same steps never share a cache entry"""
+    monkeypatch.setattr(Config, "TASK_MODE", "browser")
+    task = {"url": "https://example.com", "steps": [{"action": "get_text", "selector": "h1"}]}
+    
+    assert task_key({**task, "mode": "static"}) != task_key({**task, "mode": "browser"})
+    assert task_key(task) == task_key({**task, "mode": "browser"})
+    assert task_key({**task, "asset_cache": True}) != task_key({**task, "asset_cache": False})
+
+def test_logging_pipeline_samples_success_logs():
+    """Test that queued JSON logs carry the task id and sampling never drops errors"""
+    stream = io.StringIO()
+    setup_logging(level="INFO", log_format="json", sample_rate=0.0, stream=stream)
+    pipeline_logger = logging.getLogger("tests.pipeline")
+    token = task_id_var.set("task-9")
+    try:
+        pipeline_logger.info("Clicked %s", "h1", extra=SAMPLED)
+        pipeline_logger.info("Task started")
+        pipeline_logger.error("Click failed: %s", "h1", extra=SAMPLED)
+    finally:
+        task_id_var.reset(token)
+        stop_logging()
+    
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["message"] for record in records] == ["Task started", "Click failed: h1"]
+    assert records[1]["level"] == "ERROR"
+    assert all(record["task_id"] == "task-9" for record in records)
+
 if __name__ == "__main__":
     asyncio.run(test_task_executor())